@@ -0,0 +1,23 @@
+# -------------------------------------------------#
+# Shared tool paths and loader for the benchmark scripts and tests
+# Summary:
+#	Imports ucxn-pin-reminder.py as a module, the dash in the file name rules out a normal import
+# ------------------------------------------------#
+import os
+import sys
+import importlib.util
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+TOOL_DIR      = os.path.dirname(BENCHMARK_DIR)
+TOOL_FILE     = os.path.join(TOOL_DIR, "ucxn-pin-reminder.py")
+if TOOL_DIR not in sys.path: sys.path.insert(0, TOOL_DIR) # for _version
+
+def load_tool():
+	"""
+	Returns:
+		tool (module): a fresh ucxn-pin-reminder.py module, its __main__ block is not run so cfg, logger and the run globals are unset
+	"""
+	spec = importlib.util.spec_from_file_location("ucxn_pin_reminder", TOOL_FILE)
+	tool = importlib.util.module_from_spec(spec)
+	spec.loader.exec_module(tool)
+	return tool
@@ -0,0 +1,69 @@
+# -------------------------------------------------#
+# Micro-benchmark: per mailbox dicts vs MailboxRecord
+# Usage: python benchmark/bench_mailbox_record.py [records]
+# ------------------------------------------------#
+import sys
+import datetime
+import tracemalloc
+
+from _tool import load_tool
+
+def make_dict(i):
+	# Same shape as the dicts get_mailbox_page/get_pin_data built before MailboxRecord
+	return {
+		"ObjectId"             : f"4f1c2a7e-0000-4000-8000-{i:012d}",
+		"Alias"                : f"user{i}",
+		"Display Name"         : f"User {i}",
+		"Extension"            : str(10000+i),
+		"Email Address"        : f"user{i}@xyz.com",
+		"Creation Time"        : "2020-01-01",
+		"Self Enrollment"      : "false",
+		"LDAP"                 : "true",
+		"Auth Rule"            : "Recommended Voice Mail Authentication Rule",
+		"Expiration Days"      : "90",
+		"PIN Doesnt Expire"    : "false",
+		"PIN Must Change"      : "false",
+		"Date Last Changed"    : datetime.date(2022, 1, 1) + datetime.timedelta(days=i % 90),
+		"Expiration Date"      : datetime.date(2022, 4, 1) + datetime.timedelta(days=i % 90),
+		"Days Until Expired"   : i % 90,
+		"Expiration Email Sent": "false"
+	}
+
+def make_record(tool, i):
+	m = tool.MailboxRecord(
+		object_id       = f"4f1c2a7e-0000-4000-8000-{i:012d}",
+		alias           = f"user{i}",
+		display_name    = f"User {i}",
+		extension       = str(10000+i),
+		email_address   = f"user{i}@xyz.com",
+		creation_time   = "2020-01-01",
+		self_enrollment = False,
+		ldap            = True
+	)
+	m.auth_rule             = "Recommended Voice Mail Authentication Rule"
+	m.expiration_days       = 90
+	m.pin_doesnt_expire     = False
+	m.pin_must_change       = False
+	m.date_last_changed     = datetime.date(2022, 1, 1) + datetime.timedelta(days=i % 90)
+	m.expiration_date       = datetime.date(2022, 4, 1) + datetime.timedelta(days=i % 90)
+	m.days_until_expired    = i % 90
+	m.expiration_email_sent = False
+	return m
+
+def measure(factory, records):
+	tracemalloc.start()
+	items = [factory(i) for i in range(records)]
+	current, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	del items
+	return current
+
+if __name__ == "__main__":
+	records = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+	tool = load_tool()
+	dict_bytes   = measure(make_dict, records)
+	record_bytes = measure(lambda i: make_record(tool, i), records)
+	print(f"Records:       {records}")
+	print(f"dict:          {dict_bytes/1048576:8.1f} MB ({dict_bytes/records:.0f} bytes/record)")
+	print(f"MailboxRecord: {record_bytes/1048576:8.1f} MB ({record_bytes/records:.0f} bytes/record)")
+	print(f"Savings:       {(1 - record_bytes/dict_bytes)*100:8.1f} %")
@@ -0,0 +1,100 @@
+# -------------------------------------------------#
+# CUPI response decoding check
+# Summary:
+#	Decodes recorded CUPI response bodies with the old path, requests' response.json(), and the tool's response_json()
+#	response_json() uses orjson when it is installed and keeps only the fields the tool uses of PIN and user records
+#	Also reports how much gzip shrinks each kind of response and what decompressing it costs
+#	Payloads are recorded from the fake CUPI server unless -payloads points at bodies saved from a real UCXN,
+#	users-*.json mailbox list pages and pin-*.json credential/pin records
+# Usage: python benchmark/check_decode.py [-payloads DIR] [-rows_per_page 2000] [-runs 20]
+# ------------------------------------------------#
+import os
+import sys
+import glob
+import gzip
+import time
+import shutil
+import tempfile
+import threading
+
+import fake_cupi
+from _tool import load_tool
+
+def record_payloads(payload_dir, rows_per_page, pins=200):
+	"""
+	GETs a mailbox list page and PIN records from the fake CUPI server and saves the bodies
+	"""
+	import requests
+	server = fake_cupi.make_server(rows_per_page)
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	base_url = f"http://127.0.0.1:{server.server_address[1]}/vmrest/users"
+	try:
+		with requests.Session() as session:
+			files = {"users-1.json": f"{base_url}?rowsPerPage={rows_per_page}&pageNumber=1"}
+			for i in range(pins): files[f"pin-{i}.json"] = f"{base_url}/{fake_cupi.object_id(i)}/credential/pin"
+			for name, url in files.items():
+				with open(os.path.join(payload_dir, name), "wb") as f: f.write(session.get(url).content)
+	finally:
+		server.shutdown()
+
+def time_per_body(decode, bodies, runs):
+	"""
+	Returns:
+		us (float): mean microseconds to decode one body, best of runs
+	"""
+	best = None
+	for _ in range(runs):
+		time_start = time.perf_counter()
+		for body in bodies: decode(body)
+		seconds = time.perf_counter() - time_start
+		best = seconds if best is None else min(best, seconds)
+	return best / len(bodies) * 1e6
+
+if __name__ == "__main__":
+	import requests
+	payload_dir   = None
+	rows_per_page = 2000
+	runs          = 20
+	args = sys.argv[1:]
+	while args:
+		arg = args.pop(0)
+		if   arg == "-payloads":      payload_dir   = args.pop(0)
+		elif arg == "-rows_per_page": rows_per_page = int(args.pop(0))
+		elif arg == "-runs":          runs          = int(args.pop(0))
+		else: sys.exit(f"{arg} is not a valid option\nUsage: python benchmark/check_decode.py [-payloads DIR] [-rows_per_page 2000] [-runs 20]")
+
+	tool = load_tool()
+	work_dir = None
+	if payload_dir is None:
+		work_dir = payload_dir = tempfile.mkdtemp(prefix="ucxn-payloads-")
+		record_payloads(payload_dir, rows_per_page)
+	try:
+		kinds = {}
+		for kind, pattern, fields in (("users page", "users-*.json", None), ("pin record", "pin-*.json", tool.PIN_FIELDS)):
+			bodies = []
+			for path in sorted(glob.glob(os.path.join(payload_dir, pattern))):
+				with open(path, "rb") as f: bodies.append(f.read())
+			if bodies: kinds[kind] = (bodies, fields)
+	finally:
+		if work_dir is not None: shutil.rmtree(work_dir, ignore_errors=True)
+	if not kinds: sys.exit(f"No users-*.json or pin-*.json payloads in {payload_dir}")
+
+	def response(body):
+		r = requests.Response()
+		r._content    = body
+		r.status_code = 200
+		return r
+
+	tool.response_json(response(b"{}")) # picks the decoder
+	decoder = "orjson" if tool.json_decode.__module__ == "orjson" else "json (pip install orjson for the fast path)"
+	print(f"Decoder: {decoder}")
+	print(f"{'Payload':<12}{'Count':>7}{'KB':>9}{'gzip KB':>9}{'gunzip us':>11}{'response.json() us':>20}{'response_json() us':>20}{'Speedup':>9}")
+	for kind, (bodies, fields) in kinds.items():
+		responses  = [response(b) for b in bodies]
+		compressed = [gzip.compress(b, 6) for b in bodies]
+		old_us     = time_per_body(lambda r: r.json(), responses, runs)
+		new_us     = time_per_body(lambda r: tool.response_json(r, fields), responses, runs)
+		gunzip_us  = time_per_body(gzip.decompress, compressed, runs)
+		kb         = sum(len(b) for b in bodies) / len(bodies) / 1024
+		gzip_kb    = sum(len(b) for b in compressed) / len(bodies) / 1024
+		print(f"{kind:<12}{len(bodies):>7}{kb:>9.1f}{gzip_kb:>9.1f}{gunzip_us:>11.0f}{old_us:>20.0f}{new_us:>20.0f}{old_us / new_us:>8.1f}x")
@@ -0,0 +1,67 @@
+# -------------------------------------------------#
+# Startup import time check
+# Summary:
+#	Runs the tool with -h under python -X importtime and adds up the time spent importing modules
+#	Fails if a heavy dependency is imported at startup, they must be imported where they are first used
+#	The import times are only reported, they depend on the machine, tests/test_importtime.py asserts the same check
+# Usage: python benchmark/check_importtime.py [-runs 5]
+# ------------------------------------------------#
+import sys
+import statistics
+import subprocess
+
+from _tool import TOOL_DIR, TOOL_FILE
+
+# must not be imported before the phase that uses them
+LAZY_MODULES = ("requests", "urllib3", "numpy", "xlsxwriter", "tqdm", "sqlite3", "smtplib", "email.mime", "multiprocessing", "concurrent.futures.process", "pyarrow", "orjson")
+
+def import_times():
+	"""
+	Runs the tool once with -h
+
+	Returns:
+		imports (dict): top level module name: cumulative import time in microseconds
+		modules (set): every module imported, including nested imports
+	"""
+	proc = subprocess.run([sys.executable, "-X", "importtime", TOOL_FILE, "-h"], cwd=TOOL_DIR, capture_output=True, text=True)
+	if proc.returncode != 0: sys.exit(f"Tool exited with {proc.returncode}:\n{proc.stderr}")
+	imports = {}
+	modules = set()
+	for line in proc.stderr.splitlines():
+		if not line.startswith("import time:"): continue
+		self_us, cumulative_us, name = line[len("import time:"):].split("|")
+		if not cumulative_us.strip().isdigit(): continue # header line
+		modules.add(name.strip())
+		if not name.startswith("  "): imports[name.strip()] = int(cumulative_us) # top level, nested imports are indented
+	return imports, modules
+
+def eager_modules(modules):
+	"""
+	Returns:
+		eager (list[str]): modules imported at startup that should only be imported where they are used
+	"""
+	return sorted(m for m in modules if any(m == lazy or m.startswith(lazy + ".") for lazy in LAZY_MODULES))
+
+if __name__ == "__main__":
+	runs = 5
+	args = sys.argv[1:]
+	while args:
+		arg = args.pop(0)
+		if arg == "-runs": runs = int(args.pop(0))
+		else: sys.exit(f"{arg} is not a valid option\nUsage: python benchmark/check_importtime.py [-runs 5]")
+
+	totals = []
+	for _ in range(runs):
+		imports, modules = import_times()
+		totals.append(sum(imports.values()) / 1000)
+
+	print("Slowest top level imports (last run):")
+	for name, us in sorted(imports.items(), key=lambda x: x[1], reverse=True)[:10]:
+		print(f"  {us/1000:>8.1f} ms  {name}")
+	print(f"Startup import time: {statistics.median(totals):.1f} ms median of {runs} runs")
+
+	eager = eager_modules(modules)
+	if eager:
+		print(f"FAIL: imported at startup, should be imported where they are used: {', '.join(eager)}")
+		sys.exit(1)
+	print("OK")
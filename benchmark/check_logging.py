@@ -0,0 +1,99 @@
+# -------------------------------------------------#
+# Logging overhead check
+# Summary:
+#	Logs the per request debug line from several threads, like the PIN fetch workers do
+#	Compares a FileHandler on the calling thread (the old setup) with the tool's queued logging, debug on and off
+#	Reports how long the logging threads were held up per line, and how long the listener took to catch up
+# Usage: python benchmark/check_logging.py [-threads 8] [-lines 2000] [-gap_ms 1]
+# ------------------------------------------------#
+import os
+import sys
+import time
+import atexit
+import shutil
+import logging
+import tempfile
+import threading
+
+from _tool import TOOL_DIR, load_tool
+
+URL = "https://ucxn-1.xyz.com/vmrest/users/u0001234-0000-4000-8000-000000000000/credential/pin"
+
+def run_threads(log, threads, lines, gap_ms):
+	"""
+	Each thread logs its lines with gap_ms between them, standing in for the CUPI request each debug line follows
+
+	Returns:
+		us_per_line (float): mean time a thread spent inside the logging call
+	"""
+	spent = []
+	def worker():
+		in_log = 0.0
+		for _ in range(lines):
+			time_call = time.perf_counter()
+			log(URL)
+			in_log += time.perf_counter() - time_call
+			if gap_ms: time.sleep(gap_ms / 1000)
+		spent.append(in_log)
+	workers = [threading.Thread(target=worker) for _ in range(threads)]
+	for t in workers: t.start()
+	for t in workers: t.join()
+	return sum(spent) / (threads * lines) * 1e6
+
+def direct(threads, lines, gap_ms):
+	"""
+	The old setup, f-string debug lines formatted and written by a FileHandler on the calling thread
+	"""
+	logger  = logging.getLogger("direct")
+	handler = logging.FileHandler("direct.log")
+	handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(module)s -> %(message)s'))
+	logger.addHandler(handler)
+	logger.setLevel(logging.DEBUG)
+	us_per_line = run_threads(lambda url: logger.debug(f"GET = {url}"), threads, lines, gap_ms)
+	handler.close()
+	return us_per_line, 0.0
+
+def queued(threads, lines, gap_ms, debug_lvl):
+	"""
+	The tool's logging, lazy %-args put on a queue and written by the QueueListener thread
+
+	Returns:
+		(us_per_line, drain_seconds) (tuple): drain_seconds is how long the listener took to write the rest after the workers finished
+	"""
+	tool = load_tool()
+	tool.logger = logging.getLogger(f"queued-{debug_lvl}")
+	tool.init_logger(debug_lvl)
+	tool.apply_log_settings()
+	us_per_line = run_threads(lambda url: tool.logger.debug("GET = %s", url), threads, lines, gap_ms)
+	time_drain = time.perf_counter()
+	tool.stop_logging()
+	atexit.unregister(tool.stop_logging)
+	return us_per_line, time.perf_counter() - time_drain
+
+if __name__ == "__main__":
+	threads = 8
+	lines   = 2000
+	gap_ms  = 1.0
+	args = sys.argv[1:]
+	while args:
+		arg = args.pop(0)
+		if   arg == "-threads": threads = int(args.pop(0))
+		elif arg == "-lines":   lines   = int(args.pop(0))
+		elif arg == "-gap_ms":  gap_ms  = float(args.pop(0))
+		else: sys.exit(f"{arg} is not a valid option\nUsage: python benchmark/check_logging.py [-threads 8] [-lines 2000] [-gap_ms 1]")
+
+	work_dir = tempfile.mkdtemp(prefix="ucxn-log-")
+	os.chdir(work_dir)
+	try:
+		results = [
+			("FileHandler on the calling thread", direct(threads, lines, gap_ms)),
+			("queued, debug = 1",                 queued(threads, lines, gap_ms, "1")),
+			("queued, debug = 0",                 queued(threads, lines, gap_ms, "0"))
+		]
+	finally:
+		os.chdir(TOOL_DIR)
+		shutil.rmtree(work_dir, ignore_errors=True)
+
+	print(f"{threads} threads x {lines} debug lines, {gap_ms:g} ms apart")
+	for name, (us_per_line, drain_seconds) in results:
+		print(f"  {name:<34}{us_per_line:>7.1f} us per line on the workers  {drain_seconds:>5.2f}s listener drain")
@@ -0,0 +1,242 @@
+# -------------------------------------------------#
+# Fake CUPI server for offline benchmarks
+# Summary:
+#	Serves synthetic Unity Connection data over http for the tool to run against
+#	/vmrest/authenticationrules
+#	/vmrest/users (paged, rowsPerPage=0 returns @total, query=(column is|startswith value))
+#	/vmrest/users/{ObjectId}
+#	/vmrest/users/{ObjectId}/credential/pin
+#	Optionally throttles like a busy UCXN, 429 with Retry-After above max_concurrent requests in flight
+#	Optionally gzips responses, like UCXN with Tomcat compression on
+# Usage: python benchmark/fake_cupi.py [-mailboxes 1000] [-port 8443] [-latency_ms 0] [-error_rate 0] [-max_concurrent 0] [-gzip 0]
+# ------------------------------------------------#
+import sys
+import gzip
+import json
+import time
+import re
+import random
+import datetime
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+AUTH_RULES = [
+	{"ObjectId": "a0000000-0000-4000-8000-000000000001", "DisplayName": "Recommended Voice Mail Authentication Rule", "MaxDays": "90"},
+	{"ObjectId": "a0000000-0000-4000-8000-000000000002", "DisplayName": "Never Expires",                              "MaxDays": "0"},
+	{"ObjectId": "a0000000-0000-4000-8000-000000000003", "DisplayName": "Executive Authentication Rule",              "MaxDays": "180"}
+]
+
+def object_id(i):
+	return f"u{i:07d}-0000-4000-8000-000000000000"
+
+def object_index(oid):
+	return int(oid[1:8])
+
+def make_user(i):
+	"""
+	Synthetic user list entry, the same index always returns the same user
+	"""
+	rnd = random.Random(i)
+	user = {
+		"ObjectId"    : object_id(i),
+		"Alias"       : f"user{i}",
+		"DisplayName" : f"User {i}",
+		"DtmfAccessId": str(100000+i),
+		"CreationTime": "2020-01-01T00:00:00Z",
+		"IsVmEnrolled": "false" if rnd.random() < 0.9 else "true",
+		"LdapType"    : "3" if rnd.random() < 0.8 else "0"
+	}
+	if rnd.random() < 0.95: user["EmailAddress"] = f"user{i}@example.com" # some mailboxes have no email address
+	user.update(user_extra_fields(i))
+	return user
+
+def user_extra_fields(i):
+	"""
+	Fields a UCXN mailbox list returns that the tool does not use, so pages are the size of real CUPI pages
+	"""
+	oid = object_id(i)
+	return {
+		"URI"                : f"/vmrest/users/{oid}",
+		"FirstName"          : "User",
+		"LastName"           : str(i),
+		"UseDefaultLanguage" : "true",
+		"UseDefaultTimeZone" : "true",
+		"TimeZone"           : "35",
+		"Language"           : "1033",
+		"ListInDirectory"    : "true",
+		"IsTemplate"         : "false",
+		"SmtpAddress"        : f"user{i}@ucxn-1.example.com",
+		"Department"         : "Sales",
+		"City"               : "Springfield",
+		"Title"              : "Analyst",
+		"EmployeeId"         : str(500000+i),
+		"CosObjectId"        : "c0000000-0000-4000-8000-000000000001",
+		"CosURI"             : "/vmrest/coses/c0000000-0000-4000-8000-000000000001",
+		"LocationObjectId"   : "10000000-0000-4000-8000-000000000001",
+		"LocationURI"        : "/vmrest/locations/connectionlocations/10000000-0000-4000-8000-000000000001",
+		"PartitionObjectId"  : "20000000-0000-4000-8000-000000000001",
+		"PartitionURI"       : "/vmrest/partitions/20000000-0000-4000-8000-000000000001",
+		"LdapCcmUserId"      : f"user{i}",
+		"LdapCcmPkid"        : f"p{i:07d}-0000-4000-8000-000000000000",
+		"VoiceNameRequired"  : "false",
+		"MediaSwitchObjectId": "30000000-0000-4000-8000-000000000001",
+		"PhoneSystemURI"     : "/vmrest/phonesystems/30000000-0000-4000-8000-000000000001"
+	}
+
+QUERY_RE = re.compile(r"^\((\w+) (is|startswith) (.*)\)$", re.IGNORECASE)
+
+def query_matches(server, query):
+	"""
+	Indexes of the users matching a CUPI query, kept per query so paging does not rebuild every user
+
+	Returns:
+		matches (list[int]), None if the query is not valid
+	"""
+	with server.lock:
+		if query in server.queries: return server.queries[query]
+	match = QUERY_RE.match(query)
+	if match is None: return None
+	column, op, value = match.group(1).lower(), match.group(2).lower(), match.group(3).lower()
+	matches = []
+	for i in range(server.mailboxes):
+		field = {k.lower(): v for k, v in make_user(i).items()}.get(column, "").lower()
+		if field == value or (op == "startswith" and field.startswith(value)): matches.append(i)
+	with server.lock: server.queries[query] = matches
+	return matches
+
+def make_pin(i):
+	"""
+	Synthetic credential/pin record, TimeChanged is spread over the last 200 days
+	"""
+	rnd = random.Random(-i-1)
+	time_changed = datetime.datetime.now() - datetime.timedelta(days=rnd.randint(0, 200), seconds=rnd.randint(0, 86399))
+	oid = object_id(i)
+	return {
+		"URI"                     : f"/vmrest/users/{oid}/credential/pin",
+		"UserObjectId"            : oid,
+		"CredentialType"          : "4",
+		"IsPrimary"               : "false",
+		"CredentialPolicyObjectId": rnd.choices(AUTH_RULES, weights=(85, 10, 5))[0]["ObjectId"],
+		"CantChange"              : "false",
+		"DoesntExpire"            : "true" if rnd.random() < 0.05 else "false",
+		"CredMustChange"          : "true" if rnd.random() < 0.02 else "false",
+		"TimeChanged"             : time_changed.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],
+		"Locked"                  : "false",
+		"HackCount"               : "0",
+		"Hacked"                  : "false",
+		"TimeLastHacked"          : "",
+		"EncryptionType"          : "4",
+		"Credentials"             : "0" * 64,
+		"ObjectId"                : f"k{i:07d}-0000-4000-8000-000000000000",
+		"Alias"                   : f"user{i}",
+		"UserURI"                 : f"/vmrest/users/{oid}"
+	}
+
+class CupiHandler(BaseHTTPRequestHandler):
+	protocol_version        = "HTTP/1.1" # keep-alive, like UCXN
+	disable_nagle_algorithm = True       # headers and body are separate writes, Nagle would add ~40ms per request
+
+	def log_message(self, format, *args):
+		pass
+
+	def send_json(self, obj, status=200, headers={}):
+		body = json.dumps(obj).encode()
+		self.send_response(status)
+		self.send_header("Content-Type", "application/json")
+		if self.server.gzip and len(body) >= 2048 and "gzip" in self.headers.get("Accept-Encoding", ""): # Tomcat's default compressionMinSize
+			body = gzip.compress(body, 6)
+			self.send_header("Content-Encoding", "gzip")
+		for k, v in headers.items(): self.send_header(k, v)
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def do_GET(self):
+		server = self.server
+		with server.lock:
+			server.requests  += 1
+			server.in_flight += 1
+			throttled = server.max_concurrent > 0 and server.in_flight > server.max_concurrent
+			if throttled: server.throttled += 1
+		try:
+			if throttled: return self.send_json({}, 429, {"Retry-After": "1"})
+			self.handle_get()
+		finally:
+			with server.lock: server.in_flight -= 1
+
+	def handle_get(self):
+		server = self.server
+		if server.latency > 0: time.sleep(server.latency)
+		url   = urlparse(self.path)
+		query = parse_qs(url.query)
+		parts = [p for p in url.path.split("/") if p]
+
+		if parts == ["vmrest", "authenticationrules"]:
+			return self.send_json({"@total": str(len(AUTH_RULES)), "AuthenticationRule": AUTH_RULES})
+
+		if parts == ["vmrest", "users"]:
+			rows_per_page = int(query.get("rowsPerPage", ["100"])[0])
+			page_number   = int(query.get("pageNumber", ["1"])[0])
+			indexes       = range(server.mailboxes)
+			if "query" in query:
+				indexes = query_matches(server, query["query"][0])
+				if indexes is None: return self.send_json({}, 400)
+			if rows_per_page == 0: return self.send_json({"@total": str(len(indexes))})
+			first = (page_number-1) * rows_per_page
+			users = [make_user(i) for i in indexes[first:first+rows_per_page]]
+			if len(users) == 1: users = users[0] # UCXN returns a dict instead of a list for a single user
+			return self.send_json({"@total": str(len(indexes)), "User": users})
+
+		if len(parts) in (3, 5) and parts[:2] == ["vmrest", "users"]:
+			try:
+				i = object_index(parts[2])
+			except ValueError:
+				return self.send_json({}, 404)
+			if i >= server.mailboxes: return self.send_json({}, 404)
+			if server.error_rate > 0 and random.random() < server.error_rate:
+				with server.lock: server.errors += 1
+				return self.send_json({}, 503)
+			if len(parts) == 3: return self.send_json(make_user(i))
+			if parts[3:] == ["credential", "pin"]: return self.send_json(make_pin(i))
+
+		self.send_json({}, 404)
+
+def make_server(mailboxes=1000, port=0, latency_ms=0, error_rate=0, max_concurrent=0, gzip=False):
+	"""
+	Creates the fake CUPI server, call serve_forever() on it (or in a thread)
+
+	Args:
+		mailboxes (int): number of synthetic mailboxes
+		port (int): 0 picks a free port, see server.server_address
+		latency_ms (float): delay added to every request
+		error_rate (float): 0-1 chance a per mailbox request returns 503
+		max_concurrent (int): requests in flight above this get 429 Retry-After: 1, 0 never throttles
+		gzip (bool): gzip responses of 2 KB or more when the client accepts it, like UCXN with Tomcat compression on
+
+	Returns:
+		server (ThreadingHTTPServer)
+	"""
+	server = ThreadingHTTPServer(("127.0.0.1", port), CupiHandler)
+	server.daemon_threads = True
+	server.mailboxes  = mailboxes
+	server.latency    = latency_ms / 1000
+	server.error_rate = error_rate
+	server.requests   = 0
+	server.errors     = 0
+	server.max_concurrent = max_concurrent
+	server.in_flight      = 0
+	server.throttled      = 0
+	server.queries        = {}
+	server.gzip           = gzip
+	server.lock       = threading.Lock()
+	return server
+
+if __name__ == "__main__":
+	args = {"-mailboxes": "1000", "-port": "8443", "-latency_ms": "0", "-error_rate": "0", "-max_concurrent": "0", "-gzip": "0"}
+	for k, v in zip(sys.argv[1::2], sys.argv[2::2]):
+		if k not in args: sys.exit(f"{k} is not a valid option")
+		args[k] = v
+	server = make_server(int(args["-mailboxes"]), int(args["-port"]), float(args["-latency_ms"]), float(args["-error_rate"]), int(args["-max_concurrent"]), args["-gzip"] == "1")
+	print(f"Fake CUPI serving {args['-mailboxes']} mailboxes on http://127.0.0.1:{server.server_address[1]}")
+	server.serve_forever()
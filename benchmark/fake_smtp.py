@@ -0,0 +1,88 @@
+# -------------------------------------------------#
+# Fake SMTP sink for offline benchmarks
+# Summary:
+#	Accepts and discards mail, counting messages, connections and messages per recipient
+#	Addresses in server.refused are answered 550 on RCPT, like a mailbox the server does not know
+#	Only implements the commands smtplib uses to send
+# Usage: python benchmark/fake_smtp.py [-port 8025]
+# ------------------------------------------------#
+import sys
+import threading
+import collections
+import socketserver
+
+class SmtpHandler(socketserver.StreamRequestHandler):
+	disable_nagle_algorithm = True
+
+	def reply(self, line):
+		self.wfile.write(line.encode() + b"\r\n")
+
+	def handle(self):
+		server = self.server
+		with server.lock: server.connections += 1
+		self.reply("220 fake-smtp ready")
+		recipients = []
+		while True:
+			line = self.rfile.readline()
+			if not line: return
+			cmd = line[:4].upper()
+			if cmd in (b"EHLO", b"HELO"):
+				self.reply("250 fake-smtp")
+			elif cmd in (b"MAIL", b"RSET"):
+				recipients = []
+				self.reply("250 OK")
+			elif cmd == b"RCPT":
+				address = line.decode().split(":", 1)[1].strip().strip("<>")
+				if address in server.refused:
+					self.reply("550 No such user")
+					continue
+				recipients.append(address)
+				self.reply("250 OK")
+			elif cmd == b"NOOP":
+				self.reply("250 OK")
+			elif cmd == b"DATA":
+				self.reply("354 End data with <CR><LF>.<CR><LF>")
+				size = 0
+				for data in self.rfile:
+					if data in (b".\r\n", b".\n"): break
+					size += len(data)
+				with server.lock:
+					server.messages += 1
+					server.bytes    += size
+					server.recipients.update(recipients)
+				recipients = []
+				self.reply("250 OK queued")
+			elif cmd == b"QUIT":
+				self.reply("221 Bye")
+				return
+			else:
+				self.reply("502 Command not implemented")
+
+class SmtpServer(socketserver.ThreadingTCPServer):
+	daemon_threads      = True
+	allow_reuse_address = True
+
+def make_server(port=0):
+	"""
+	Creates the fake SMTP sink, call serve_forever() on it (or in a thread)
+
+	Args:
+		port (int): 0 picks a free port, see server.server_address
+
+	Returns:
+		server (SmtpServer)
+	"""
+	server = SmtpServer(("127.0.0.1", port), SmtpHandler)
+	server.messages    = 0
+	server.connections = 0
+	server.bytes       = 0
+	server.recipients  = collections.Counter() # messages per recipient address
+	server.refused     = set()                 # addresses answered 550 on RCPT
+	server.lock        = threading.Lock()
+	return server
+
+if __name__ == "__main__":
+	port = int(sys.argv[2]) if len(sys.argv) > 2 and sys.argv[1] == "-port" else 8025
+	server = make_server(port)
+	print(f"Fake SMTP listening on 127.0.0.1:{server.server_address[1]}")
+	server.serve_forever()
@@ -0,0 +1,194 @@
+# -------------------------------------------------#
+# Offline benchmark runner
+# Summary:
+#	Runs the tool against the fake CUPI server and fake SMTP sink at several mailbox counts
+#	Times each of the six steps from the tool log, records throughput and peak RSS
+#	Saves the results as JSON so versions can be compared
+# Usage: python benchmark/run_benchmark.py [OPTION]...
+# ------------------------------------------------#
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import datetime
+import tempfile
+import threading
+import subprocess
+import configparser
+
+import fake_cupi
+import fake_smtp
+from _tool import BENCHMARK_DIR, TOOL_DIR, TOOL_FILE
+import _version as version_info
+
+usage_help = """
+Usage: python benchmark/run_benchmark.py [OPTION]...
+
+Optional Arguments:
+  -sizes 1000,10000       comma separated mailbox counts to run, default 1000,10000 (100000 for a full run)
+  -latency_ms 0           delay the fake CUPI server adds to every request
+  -error_rate 0           0-1 chance a per mailbox request returns 503
+  -max_concurrent 0       fake CUPI answers 429 above this many requests in flight, 0 never throttles
+  -gzip                   fake CUPI gzips responses, like UCXN with Tomcat compression on
+  -set SECTION.key=value  overrides a config.ini setting, can be repeated
+  -noemail                runs the tool with -noemail
+  -output FILE            results file, default benchmark/results/benchmark-<version>-<build>-<timestamp>.json
+  -h, -help               display this help and exit"""
+
+STEP_MESSAGE = r"(Steps? ([\d-]+) of 6: [^.]+|Tool Finished)"
+STEP_RE      = re.compile(r"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3}) - \w+ - .* -> " + STEP_MESSAGE) # log_format text
+STEP_JSON_RE = re.compile(STEP_MESSAGE) # message of a log_format json line
+
+def write_config(work_dir, cupi_port, smtp_port, overrides):
+	"""
+	Writes a config.ini based on the repo config pointing at the fake servers
+	"""
+	config = configparser.ConfigParser()
+	config.read(os.path.join(TOOL_DIR, "config.ini"))
+	config.set("UNITY", "server", f"http://127.0.0.1:{cupi_port}")
+	config.set("UNITY", "username", "bench")
+	config.set("UNITY", "password", "bench")
+	config.set("SMTP", "server", f"127.0.0.1:{smtp_port}")
+	config.set("SMTP", "email_intervals", "15,10,7,5,3,2,1,0")
+	config.set("DEBUG", "debug", "1")
+	for section, key, value in overrides:
+		if not config.has_section(section): config.add_section(section)
+		config.set(section, key, value)
+	with open(os.path.join(work_dir, "config.ini"), "w") as f:
+		config.write(f)
+
+def parse_steps(log_file):
+	"""
+	Returns:
+		steps (list[dict]): name and seconds of each step, from the step log lines, log_format text or json
+	"""
+	marks = []
+	with open(log_file, "r") as f:
+		for line in f:
+			if line.startswith("{"):
+				entry = json.loads(line)
+				match = STEP_JSON_RE.match(entry["message"])
+				if match: marks.append((datetime.datetime.strptime(entry["time"], "%Y-%m-%d %H:%M:%S,%f"), match.group(1), match.group(2)))
+				continue
+			match = STEP_RE.match(line)
+			if match: marks.append((datetime.datetime.strptime(match.group(1), "%Y-%m-%d %H:%M:%S,%f"), match.group(2), match.group(3)))
+	if len(marks) < 2: print(f"Warning: no step timings found in {log_file}", flush=True)
+	steps = []
+	for (start, name, step), (end, _, _) in zip(marks, marks[1:]):
+		steps.append({"step": step, "name": name, "seconds": round((end - start).total_seconds(), 3)})
+	return steps
+
+def run_tool(work_dir, tool_args):
+	"""
+	Runs the tool and waits for it
+
+	Returns:
+		(exit_code, wall_seconds, peak_rss_mb) (tuple): peak_rss_mb is None where os.wait4 is not available (Windows)
+	"""
+	with open(os.path.join(work_dir, "console.txt"), "w") as console:
+		time_start = time.perf_counter()
+		proc = subprocess.Popen([sys.executable, TOOL_FILE] + tool_args, cwd=work_dir, stdout=console, stderr=subprocess.STDOUT)
+		if hasattr(os, "wait4"):
+			_, status, rusage = os.wait4(proc.pid, 0)
+			proc.returncode = os.waitstatus_to_exitcode(status)
+			peak_rss_mb = rusage.ru_maxrss / (1048576 if sys.platform == "darwin" else 1024) # bytes on macOS, KB on Linux
+		else:
+			proc.wait()
+			peak_rss_mb = None
+		return proc.returncode, round(time.perf_counter() - time_start, 3), peak_rss_mb
+
+def run_size(mailboxes, latency_ms, error_rate, max_concurrent, gzip, overrides, tool_args):
+	cupi = fake_cupi.make_server(mailboxes, 0, latency_ms, error_rate, max_concurrent, gzip)
+	smtp = fake_smtp.make_server(0)
+	for server in (cupi, smtp): threading.Thread(target=server.serve_forever, daemon=True).start()
+	work_dir = tempfile.mkdtemp(prefix="ucxn-bench-")
+	try:
+		shutil.copytree(os.path.join(TOOL_DIR, "email_assets"), os.path.join(work_dir, "email_assets"))
+		write_config(work_dir, cupi.server_address[1], smtp.server_address[1], overrides)
+		print(f"Running {mailboxes} mailboxes...", flush=True)
+		exit_code, wall_seconds, peak_rss_mb = run_tool(work_dir, tool_args)
+		log_dir  = os.path.join(work_dir, "logs")
+		log_file = os.path.join(log_dir, sorted(f for f in os.listdir(log_dir) if f.endswith(".log"))[-1])
+		result = {
+			"mailboxes"           : mailboxes,
+			"exit_code"           : exit_code,
+			"wall_seconds"        : wall_seconds,
+			"mailboxes_per_second": round(mailboxes / wall_seconds, 1),
+			"peak_rss_mb"         : round(peak_rss_mb, 1) if peak_rss_mb is not None else None,
+			"steps"               : parse_steps(log_file),
+			"cupi_requests"       : cupi.requests,
+			"cupi_errors_injected": cupi.errors,
+			"cupi_throttled"      : cupi.throttled,
+			"emails"              : smtp.messages,
+			"smtp_connections"    : smtp.connections
+		}
+		if exit_code != 0:
+			with open(os.path.join(work_dir, "console.txt"), "r") as f: result["console_tail"] = f.read()[-2000:]
+		return result
+	finally:
+		cupi.shutdown()
+		smtp.shutdown()
+		shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+	sizes      = [1000, 10000]
+	latency_ms = 0.0
+	error_rate = 0.0
+	max_concurrent = 0
+	gzip       = False
+	overrides  = []
+	tool_args  = []
+	output     = None
+	args = sys.argv[1:]
+	try:
+		while args:
+			arg = args.pop(0)
+			if   arg == "-sizes":      sizes      = [int(x) for x in args.pop(0).split(",")]
+			elif arg == "-latency_ms": latency_ms = float(args.pop(0))
+			elif arg == "-error_rate": error_rate = float(args.pop(0))
+			elif arg == "-max_concurrent": max_concurrent = int(args.pop(0))
+			elif arg == "-output":     output     = args.pop(0)
+			elif arg == "-noemail":    tool_args.append("-noemail")
+			elif arg == "-gzip":       gzip       = True
+			elif arg == "-set":
+				setting, value = args.pop(0).split("=", 1)
+				section, key   = setting.split(".", 1)
+				overrides.append((section, key, value))
+			elif arg == "-h" or arg == "-help":
+				print(usage_help)
+				sys.exit(0)
+			else:
+				raise ValueError(arg)
+	except (ValueError, IndexError) as e:
+		print(f"\nInvalid option {e}")
+		print(usage_help)
+		sys.exit(1)
+
+	results = {
+		"version"   : version_info.__version__,
+		"build"     : version_info.__build__,
+		"python"    : sys.version.split()[0],
+		"platform"  : sys.platform,
+		"timestamp" : datetime.datetime.now().isoformat(timespec="seconds"),
+		"latency_ms": latency_ms,
+		"error_rate": error_rate,
+		"max_concurrent": max_concurrent,
+		"gzip"      : gzip,
+		"overrides" : [f"{s}.{k}={v}" for s, k, v in overrides],
+		"tool_args" : tool_args,
+		"runs"      : [run_size(size, latency_ms, error_rate, max_concurrent, gzip, overrides, tool_args) for size in sizes]
+	}
+
+	if output is None:
+		results_dir = os.path.join(BENCHMARK_DIR, "results")
+		if not os.path.isdir(results_dir): os.mkdir(results_dir)
+		output = os.path.join(results_dir, f"benchmark-{version_info.__version__}-{version_info.__build__}-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+	with open(output, "w") as f:
+		json.dump(results, f, indent=2)
+
+	for run in results["runs"]:
+		steps = "  ".join(f"{s['step']}={s['seconds']}s" for s in run["steps"])
+		print(f"{run['mailboxes']:>7} mailboxes  exit={run['exit_code']}  {run['wall_seconds']}s  {run['mailboxes_per_second']}/s  rss={run['peak_rss_mb']}MB  {steps}")
+	print(f"Results saved: {output}")
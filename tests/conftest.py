@@ -0,0 +1,33 @@
+# -------------------------------------------------#
+# Shared test fixtures
+# Summary:
+#	Puts the benchmark folder on sys.path for the fake servers and benchmark/_tool.py
+#	tool is ucxn-pin-reminder.py loaded as a module, for tests that call its functions directly
+#	servers starts the fake CUPI server with 300 mailboxes and the fake SMTP sink, for tests that run the tool
+# ------------------------------------------------#
+import os
+import sys
+import logging
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmark"))
+import _tool
+import fake_cupi
+import fake_smtp
+
+@pytest.fixture(scope="module")
+def tool():
+	tool = _tool.load_tool()
+	tool.logger = logging.getLogger("global-log")
+	return tool
+
+@pytest.fixture
+def servers():
+	cupi = fake_cupi.make_server(300)
+	smtp = fake_smtp.make_server(0)
+	for server in (cupi, smtp): threading.Thread(target=server.serve_forever, daemon=True).start()
+	yield cupi, smtp
+	cupi.shutdown()
+	smtp.shutdown()
@@ -0,0 +1,26 @@
+# -------------------------------------------------#
+# Checkpoint tests
+# Summary:
+#	Calls run_tool() in process, like a daemon job, with a step that fails
+#	A failed run keeps its checkpoint for -resume but must not leave the checkpoint or sent log open
+# Usage: python -m pytest tests
+# ------------------------------------------------#
+import os
+
+import pytest
+
+def test_failed_run_closes_the_checkpoint(tool, tmp_path, monkeypatch):
+	cfg = {
+		"checkpoint_file_fqdn": str(tmp_path / "checkpoint.ndjson"),
+		"sent_file_fqdn"      : str(tmp_path / "reminders_sent.ndjson"),
+		"clusters"            : [{"name": "ucxn-1.xyz.com"}],
+	}
+	for name, value in (("cfg", cfg), ("reminders_sent", {}), ("sent_log", None), ("authrules", None), ("rmode", None)):
+		monkeypatch.setattr(tool, name, value, raising=False)
+	def get_auth_rules(): raise ConnectionError("UCXN went away")
+	monkeypatch.setattr(tool, "get_auth_rules", get_auth_rules)
+
+	with pytest.raises(ConnectionError): tool.run_tool("reminders")
+	assert tool.checkpoint.file.closed
+	assert tool.sent_log is None
+	assert os.path.isfile(cfg["checkpoint_file_fqdn"]) # kept for -resume
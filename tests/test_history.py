@@ -0,0 +1,29 @@
+# -------------------------------------------------#
+# Run history tests
+# Summary:
+#	History is optional, a history.db that cannot be written must not stop the report
+# Usage: python -m pytest tests
+# ------------------------------------------------#
+import os
+import sys
+import glob
+import shutil
+import subprocess
+
+import run_benchmark
+from _tool import TOOL_DIR, TOOL_FILE
+
+ADMIN_EMAIL = "admin@xyz.com" # from config.ini
+
+def test_report_is_written_when_history_fails(servers, tmp_path):
+	cupi, smtp = servers
+	shutil.copytree(os.path.join(TOOL_DIR, "email_assets"), tmp_path / "email_assets")
+	run_benchmark.write_config(tmp_path, cupi.server_address[1], smtp.server_address[1], [("HISTORY", "enabled", "true")])
+	(tmp_path / "data").mkdir()
+	(tmp_path / "data" / "history.db").write_bytes(b"not a database" * 100)
+
+	proc = subprocess.run([sys.executable, TOOL_FILE], cwd=tmp_path, capture_output=True, text=True, timeout=300)
+	assert proc.returncode == 0, proc.stdout + proc.stderr
+	assert glob.glob(str(tmp_path / "reports" / "*.xlsx"))
+	with open(glob.glob(str(tmp_path / "logs" / "*.log"))[0]) as f: assert "history was not saved" in f.read()
+	assert smtp.recipients[ADMIN_EMAIL] == 1 # the admin email with the report is still sent
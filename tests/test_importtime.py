@@ -0,0 +1,13 @@
+# -------------------------------------------------#
+# Startup import tests
+# Summary:
+#	Runs the tool with -h under python -X importtime, see benchmark/check_importtime.py
+#	Heavy dependencies must not be imported at startup, only where they are first used
+# Usage: python -m pytest tests
+# ------------------------------------------------#
+import check_importtime
+
+def test_heavy_modules_are_not_imported_at_startup():
+	imports, modules = check_importtime.import_times()
+	assert "logging" in modules # the importtime output was parsed
+	assert check_importtime.eager_modules(modules) == []
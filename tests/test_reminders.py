@@ -0,0 +1,70 @@
+# -------------------------------------------------#
+# Reminder email tests
+# Summary:
+#	Runs the tool against the fake CUPI server and fake SMTP sink from the benchmark folder
+#	A mailbox must get at most one reminder a day, however many runs there are that day
+# Usage: python -m pytest tests
+# ------------------------------------------------#
+import os
+import sys
+import datetime
+import shutil
+import subprocess
+
+import pytest
+
+import run_benchmark
+from _tool import TOOL_DIR, TOOL_FILE
+
+ADMIN_EMAIL = "admin@xyz.com" # from config.ini
+
+@pytest.fixture
+def work_dir(tmp_path, servers):
+	cupi, smtp = servers
+	shutil.copytree(os.path.join(TOOL_DIR, "email_assets"), tmp_path / "email_assets")
+	run_benchmark.write_config(tmp_path, cupi.server_address[1], smtp.server_address[1], [])
+	return tmp_path
+
+def run_tool(work_dir, *args):
+	proc = subprocess.run([sys.executable, TOOL_FILE, *args], cwd=work_dir, capture_output=True, text=True, timeout=300)
+	assert proc.returncode == 0, proc.stdout + proc.stderr
+
+def user_reminders(smtp):
+	return {address: n for address, n in smtp.recipients.items() if address != ADMIN_EMAIL}
+
+def test_reminders_run_then_report_run_sends_one_email_per_user(servers, work_dir):
+	cupi, smtp = servers
+	run_tool(work_dir, "-r")
+	first = user_reminders(smtp)
+	assert first, "the fake CUPI data should have mailboxes due a reminder today"
+
+	run_tool(work_dir)
+	reminders = user_reminders(smtp)
+	assert reminders == first
+	assert set(reminders.values()) == {1}
+	assert smtp.recipients[ADMIN_EMAIL] == 1 # the report run still sends the admin email
+
+def test_report_run_sends_reminders_when_none_sent_today(servers, work_dir):
+	cupi, smtp = servers
+	run_tool(work_dir)
+	reminders = user_reminders(smtp)
+	assert reminders
+	assert set(reminders.values()) == {1}
+
+@pytest.mark.parametrize("now, candidate", [
+	(datetime.datetime(2024, 1, 5, 18), True),  # a PIN changed after the fetch is 15 days from expiry
+	(datetime.datetime(2024, 1, 4, 18), False), # 16 days, past the largest interval
+])
+def test_reminder_candidate_counts_pin_changes_since_the_cache_fetch(tool, monkeypatch, now, candidate):
+	# MaxDays 20, cached at 10:00 on 2024-01-01, the cached PIN expires 2024-01-18 and is not near an interval
+	monkeypatch.setattr(tool, "today", now, raising=False)
+	monkeypatch.setattr(tool, "cfg", {"email_intervals": [15, 5, 1, 0], "cache_max_age_days": 7}, raising=False)
+	monkeypatch.setattr(tool, "authrule_index", {"rule": ("Rule", 20)}, raising=False)
+	monkeypatch.setattr(tool, "pin_cache_rows", {"id": {
+		"FetchedAt"               : datetime.datetime(2024, 1, 1, 10),
+		"CredentialPolicyObjectId": "rule",
+		"DoesntExpire"            : "false",
+		"TimeChanged"             : "2023-12-29 09:00:00.000",
+	}}, raising=False)
+	m = tool.MailboxRecord("id", "alias", "Name", "1000", "user@xyz.com", "2020-01-01", "false")
+	assert tool.reminder_candidate(m) is candidate
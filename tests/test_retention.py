@@ -0,0 +1,42 @@
+# -------------------------------------------------#
+# Retention tests
+# Summary:
+#	Runs retain_folder() on a temporary folder of dated files
+#	A tarball left half written by an interrupted run must not stay behind
+# Usage: python -m pytest tests
+# ------------------------------------------------#
+import os
+import time
+import tarfile
+import datetime
+
+import pytest
+
+def write_file(folder, name, days_old):
+	path = folder / name
+	path.write_text(name)
+	mtime = time.time() - days_old*86400
+	os.utime(path, (mtime, mtime))
+	return datetime.date.fromtimestamp(mtime)
+
+def test_interrupted_tarball_is_replaced(tool, tmp_path):
+	folder = tmp_path / "logs"
+	folder.mkdir()
+	day = write_file(folder, "old.log", 5)
+	stale = folder / f"logs-archive-{day}.tar.gz.tmp"
+	stale.write_bytes(b"half written")
+
+	archived, deleted = tool.retain_folder(str(folder), (".log",), 2, 0)
+	assert (archived, deleted) == (1, 1)
+	assert sorted(os.listdir(folder)) == [f"logs-archive-{day}.tar.gz"]
+	with tarfile.open(folder / f"logs-archive-{day}.tar.gz") as tar: assert tar.getnames() == ["old.log"]
+
+def test_failed_tarball_is_removed(tool, tmp_path, monkeypatch):
+	folder = tmp_path / "logs"
+	folder.mkdir()
+	write_file(folder, "old.log", 5)
+	def fail(*args, **kwargs): raise OSError("disk full")
+	monkeypatch.setattr(tarfile.TarFile, "add", fail)
+
+	with pytest.raises(OSError): tool.retain_folder(str(folder), (".log",), 2, 0)
+	assert os.listdir(folder) == ["old.log"]
@@ -0,0 +1,45 @@
+# -------------------------------------------------#
+# SMTP connection pool tests
+# Summary:
+#	Runs SMTPPool against the fake SMTP sink
+#	An error for one message must not drop a healthy pooled connection
+# Usage: python -m pytest tests
+# ------------------------------------------------#
+import smtplib
+import threading
+
+import pytest
+
+import fake_smtp
+
+@pytest.fixture
+def smtp():
+	server = fake_smtp.make_server(0)
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	yield server
+	server.shutdown()
+
+@pytest.fixture
+def pool(tool, smtp, monkeypatch):
+	monkeypatch.setattr(tool, "metrics", tool.Metrics(), raising=False)
+	pool = tool.SMTPPool(f"127.0.0.1:{smtp.server_address[1]}")
+	yield pool
+	pool.close()
+
+def test_refused_recipient_keeps_the_connection(tool, smtp, pool):
+	smtp.refused.add("gone@xyz.com")
+	pool.sendmail("from@xyz.com", "user1@xyz.com", "Subject: 1\r\n\r\n1")
+	with pytest.raises(smtplib.SMTPRecipientsRefused): pool.sendmail("from@xyz.com", "gone@xyz.com", "Subject: 2\r\n\r\n2")
+	pool.sendmail("from@xyz.com", "user2@xyz.com", "Subject: 3\r\n\r\n3")
+	assert smtp.connections == 1
+	assert smtp.messages == 2
+	assert tool.metrics.counters[("smtp_errors", "")] == 1
+
+def test_server_disconnect_reconnects(smtp, pool):
+	pool.sendmail("from@xyz.com", "user1@xyz.com", "Subject: 1\r\n\r\n1")
+	slot = pool.slots.get()
+	slot["smtp"].close() # smtplib raises SMTPServerDisconnected, as it does when the server closed an idle connection
+	pool.slots.put(slot)
+	pool.sendmail("from@xyz.com", "user2@xyz.com", "Subject: 2\r\n\r\n2")
+	assert smtp.connections == 2
+	assert smtp.messages == 2
@@ -13,33 +13,37 @@ import datetime
 import time
 import re
 import configparser
-import requests
 import json
-import pandas
 import math
-from tqdm import tqdm
-import email, smtplib, ssl
-from email import encoders
-from email.mime.base import MIMEBase
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
+import random
+import csv
 import os
 import logging
+import logging.handlers
 import traceback
 import socket
-import xlsxwriter # used for pandas report
-from urllib3 import disable_warnings
-from urllib3.exceptions import InsecureRequestWarning
-disable_warnings(InsecureRequestWarning)
+import collections
+import queue
+import threading
+import atexit
+import signal
+import bisect
+import contextlib
+import copy
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+# requests, numpy, xlsxwriter, tqdm, sqlite3 and the email stack are imported where they are first used,
+# so -h, config errors and the pyinstaller exe start without loading them, see benchmark/check_importtime.py
 
 #! TO DO LIST
 # CONFIGURE ADMIN EMAIL INTERVALS
 # Tally stats from report and include in admin email
 
 headers = {
-	"content-type": "application/json",
-	"accept"      : "application/json",
-	"connection"  : "keep-alive"
+	"content-type"   : "application/json",
+	"accept"         : "application/json",
+	"accept-encoding": "gzip, deflate", # UCXN compresses responses when its Tomcat compression is on
+	"connection"     : "keep-alive"
 }
 
 def read_ini(cfg_file_name):
@@ -66,18 +70,60 @@ def read_ini(cfg_file_name):
 		cfg["base_url"]                           = config.get('UNITY', 'server')
 		cfg["username"]                           = config.get('UNITY', 'username')
 		cfg["password"]                           = config.get('UNITY', 'password')
+		cfg["ldap_lookup"]                        = config.get('UNITY', 'ldap_lookup', fallback='list')
+		cfg["user_query"]                         = config.get('UNITY', 'user_query', fallback='none')
+		cfg["request_timeout"]                    = config.get('UNITY', 'timeout', fallback='30')
+		cfg["max_retries"]                        = config.get('UNITY', 'max_retries', fallback='4')
+		cfg["backoff_max"]                        = config.get('UNITY', 'backoff_max', fallback='30')
 		cfg["smtp_server"]                        = config.get('SMTP', 'server')
 		cfg["from_address"]                       = config.get('SMTP', 'from_address')
+		cfg["smtp_connections"]                   = config.get('SMTP', 'connections', fallback='1')
+		cfg["smtp_max_messages"]                  = config.get('SMTP', 'max_messages_per_connection', fallback='100')
+		cfg["smtp_workers"]                       = config.get('SMTP', 'send_workers', fallback='1')
+		cfg["smtp_rate"]                          = config.get('SMTP', 'max_messages_per_second', fallback='0')
 		cfg["email_intervals"]                    = config.get('SMTP', 'email_intervals')
 		cfg["admin_email"]                        = config.get('SMTP', 'admin_email')
 		cfg["admin_report_email_file_name"]       = config.get('SMTP', 'admin_report_email_file')
+		cfg["admin_attachment_max_mb"]            = config.get('SMTP', 'admin_attachment_max_mb', fallback='10')
+		cfg["attachment_compression"]             = config.get('SMTP', 'attachment_compression', fallback='gzip')
 		cfg["user_reminder_email_file_name"]      = config.get('SMTP', 'user_reminder_email_file')
 		cfg["user_reminder_attachment_file_name"] = config.get('SMTP', 'user_reminder_attachment')
 		cfg["retention_days"]                     = config.get('LOGGING', 'retention_days')
+		cfg["archive_days"]                       = config.get('LOGGING', 'archive_days', fallback='0')
+		cfg["report_format"]                      = config.get('LOGGING', 'report_format', fallback='xlsx')
+		cfg["log_format"]                         = config.get('LOGGING', 'log_format', fallback='text')
+		cfg["log_max_mb"]                         = config.get('LOGGING', 'log_max_mb', fallback='0')
+		cfg["log_backups"]                        = config.get('LOGGING', 'log_backups', fallback='5')
+		cfg["cache_enabled"]                      = config.get('CACHE', 'enabled', fallback='false')
+		cfg["cache_max_age_days"]                 = config.get('CACHE', 'max_age_days', fallback='7')
+		cfg["history_enabled"]                    = config.get('HISTORY', 'enabled', fallback='false')
+		cfg["history_snapshot_days"]              = config.get('HISTORY', 'snapshot_days', fallback='90')
+		cfg["trend_days"]                         = config.get('HISTORY', 'trend_days', fallback='90')
+		cfg["prometheus_file"]                    = config.get('METRICS', 'prometheus_file', fallback='none')
 		cfg["debug_lvl"]                          = config.get('DEBUG', 'debug')
+		cfg["report_time"]                        = config.get('DAEMON', 'report_time', fallback='06:00')
+		cfg["reminder_interval"]                  = config.get('DAEMON', 'reminder_interval_minutes', fallback='0')
+		cfg["pin_workers"]                        = config.get('PERFORMANCE', 'pin_workers', fallback='1')
+		cfg["page_workers"]                       = config.get('PERFORMANCE', 'page_workers', fallback='1')
+		cfg["rows_per_page"]                      = config.get('PERFORMANCE', 'rows_per_page', fallback='100')
+		cfg["streaming"]                          = config.get('PERFORMANCE', 'streaming', fallback='false')
 		cfg["email_assets_folder_name"]           = "email_assets"
 		cfg["reports_folder_name"]                = "reports"
 		cfg["logs_folder_name"]                   = "logs"
+		cfg["data_folder_name"]                   = "data"
+
+		# [UNITY] plus any [UNITY.name] sections, each is a cluster processed in its own process
+		cfg["clusters"] = []
+		for section in config.sections():
+			if section != "UNITY" and not section.startswith("UNITY."): continue
+			cfg["clusters"].append({
+				"name"       : config.get(section, 'name', fallback=section[6:] or cfg["ucxn_server"]),
+				"server"     : config.get(section, 'server'),
+				"username"   : config.get(section, 'username'),
+				"password"   : config.get(section, 'password'),
+				"ldap_lookup": config.get(section, 'ldap_lookup', fallback=cfg["ldap_lookup"]),
+				"user_query" : config.get(section, 'user_query', fallback=cfg["user_query"])
+			})
 
 		return cfg
 	except Exception as e:
@@ -89,12 +135,12 @@ def validate_ini(cfg_file_name):
 	Formats and validates config elements
 
 	- Checks for blank values
-	- Prefixes https to ucxn server ip/fqdn
-	- Creates credential tuple
+	- Prefixes https to ucxn server ip/fqdn, unless it already has a scheme
+	- Creates credential tuple, for every cluster
 	- Splits strings with commas into list, then strips leading/trailing whitespace
 	- Checks for and creates directories
 	- Checks for email assets files
-	- Converts retention_days from str to int
+	- Converts retention_days, archive_days, cache, retry and worker settings from str to int/bool
 	- Changes debug level from default 2 to config value
 
 	Args:
@@ -107,14 +153,45 @@ def validate_ini(cfg_file_name):
 		for k,v in cfg.items(): # Check for blank values
 			if v == "": raise Exception(f"{k} is blank")
 
-		cfg["base_url"]        = "https://" + cfg["base_url"]
+		if not cfg["base_url"].startswith(("https://", "http://")): cfg["base_url"] = "https://" + cfg["base_url"] # an explicit http:// is kept for the benchmark stand-in server
 		cfg["creds"]           = (cfg["username"], cfg["password"])
+		for c in cfg["clusters"]:
+			for k,v in c.items():
+				if v == "": raise Exception(f"{c['name']} {k} is blank")
+			if c["ldap_lookup"] not in ("list", "user"): raise Exception(f"{c['name']} ldap_lookup must be list or user")
+			c["base_url"] = c["server"] if c["server"].startswith(("https://", "http://")) else "https://" + c["server"]
+			c["creds"]    = (c["username"], c["password"])
+		if len({c["name"] for c in cfg["clusters"]}) != len(cfg["clusters"]): raise Exception("cluster names must be unique")
 
-		cfg["email_intervals"] = [x.strip() for x in cfg["email_intervals"].split(',')] # splits into list, then strips whitespace
+		try:
+			cfg["email_intervals"] = {int(x) for x in cfg["email_intervals"].split(',')} # splits into set of days
+		except ValueError:
+			raise ValueError("email_intervals")
 		cfg["admin_email"]     = [x.strip() for x in cfg["admin_email"].split(',')]
+		if cfg["ldap_lookup"] not in ("list", "user"): raise Exception("ldap_lookup must be list or user")
+		if cfg["cache_enabled"] not in ("true", "false"): raise Exception("cache enabled must be true or false")
+		cfg["cache_enabled"]   = cfg["cache_enabled"] == "true"
+		if cfg["history_enabled"] not in ("true", "false"): raise Exception("history enabled must be true or false")
+		cfg["history_enabled"] = cfg["history_enabled"] == "true"
+		cfg["report_formats"]  = [x.strip() for x in cfg["report_format"].split(',')]
+		for f in cfg["report_formats"]:
+			if f not in REPORT_WRITERS: raise Exception(f"report_format {f} must be one of {', '.join(REPORT_WRITERS)}")
+		if len(set(cfg["report_formats"])) != len(cfg["report_formats"]): raise Exception("report_format lists a format more than once")
+		if "parquet" in cfg["report_formats"]:
+			import importlib.util
+			if importlib.util.find_spec("pyarrow") is None: raise Exception("report_format parquet needs the pyarrow package, pip install pyarrow")
+		if cfg["log_format"] not in ("text", "json"): raise Exception("log_format must be text or json")
+		if cfg["attachment_compression"] not in ("gzip", "zip", "none"): raise Exception("attachment_compression must be gzip, zip or none")
+		if cfg["streaming"] not in ("true", "false"): raise Exception("streaming must be true or false")
+		cfg["streaming"]       = cfg["streaming"] == "true"
+		cfg["cache_file_fqdn"] = os.path.join(cfg["data_folder_name"], "pin_cache.db")
+		cfg["history_file_fqdn"] = os.path.join(cfg["data_folder_name"], "history.db")
+		cfg["checkpoint_file_fqdn"] = os.path.join(cfg["data_folder_name"], "checkpoint.ndjson")
+		cfg["sent_file_fqdn"]  = os.path.join(cfg["data_folder_name"], "reminders_sent.ndjson")
 
 		if not os.path.isdir(cfg["email_assets_folder_name"]): os.mkdir(cfg["email_assets_folder_name"])
 		if not os.path.isdir(cfg["reports_folder_name"]):      os.mkdir(cfg["reports_folder_name"])
+		if not os.path.isdir(cfg["data_folder_name"]):         os.mkdir(cfg["data_folder_name"])
 
 		cfg["admin_report_email_file_fqdn_txt"]  = os.path.join(cfg["email_assets_folder_name"], cfg["admin_report_email_file_name"]+".txt")
 		cfg["admin_report_email_file_fqdn_html"] = os.path.join(cfg["email_assets_folder_name"], cfg["admin_report_email_file_name"]+".html")
@@ -132,17 +209,36 @@ def validate_ini(cfg_file_name):
 		else:
 			cfg["user_reminder_attachment_file_fqdn"] = "none"
 		
-		cfg["retention_days"] = int(cfg["retention_days"])
+		for k in ("retention_days", "archive_days", "log_backups", "cache_max_age_days", "history_snapshot_days", "trend_days", "max_retries", "reminder_interval", "pin_workers", "page_workers", "rows_per_page", "smtp_connections", "smtp_max_messages", "smtp_workers"):
+			try:
+				cfg[k] = int(cfg[k])
+			except ValueError:
+				raise ValueError(k)
+		for k, name in (("smtp_rate", "max_messages_per_second"), ("request_timeout", "timeout"), ("backoff_max", "backoff_max"), ("admin_attachment_max_mb", "admin_attachment_max_mb"), ("log_max_mb", "log_max_mb")):
+			try:
+				cfg[k] = float(cfg[k])
+			except ValueError:
+				raise ValueError(name)
+		if cfg["request_timeout"] <= 0: raise Exception("timeout must be greater than 0")
+		if cfg["max_retries"] < 0: raise Exception("max_retries must be 0 or greater")
+		if cfg["reminder_interval"] < 0: raise Exception("reminder_interval_minutes must be 0 or greater")
+		if cfg["trend_days"] < 1: raise Exception("trend_days must be 1 or greater")
+		if cfg["log_max_mb"] < 0: raise Exception("log_max_mb must be 0 or greater")
+		if cfg["archive_days"] < 0: raise Exception("archive_days must be 0 or greater")
+		if cfg["admin_attachment_max_mb"] < 0: raise Exception("admin_attachment_max_mb must be 0 or greater")
+		try:
+			datetime.datetime.strptime(cfg["report_time"], "%H:%M")
+		except ValueError:
+			raise Exception("report_time must be HH:MM")
+		for k in ("pin_workers", "page_workers", "rows_per_page", "smtp_connections", "smtp_max_messages", "smtp_workers"):
+			if cfg[k] < 1: raise Exception(f"{k} must be 1 or greater")
 
-		if cfg["debug_lvl"] == "1": # Turn off console debug msgs
-			for handler in logger.handlers:
-				if type(handler) == logging.StreamHandler:
-					handler.setLevel(logging.INFO)
+		set_log_levels(cfg["debug_lvl"])
 
 		# for k,v in cfg.items(): logger.debug(f"{k}={v}")
 		return cfg
-	except ValueError:
-		logger.error(f"Error in config file: retention_days must be a number not a string")
+	except ValueError as e:
+		logger.error(f"Error in config file: {e} must be a number not a string")
 		sys.exit(1)
 	except Exception as e:
 		logger.error(f"Error in {cfg_file_name} file: {e} on line {sys.exc_info()[2].tb_lineno}")
@@ -153,70 +249,437 @@ def init_logger(console_debug_lvl = '1'):
 	Initiates logger
 
 	- Creates log directory if none exists
-	- Creates two log handlers
-		- One for the log file
-		- Another for the console
+	- The logger only puts records on a queue unformatted, see LogQueueHandler, a QueueListener thread formats them
+	  and writes them to the log handlers, so the CUPI and SMTP worker threads never format or wait on file or console writes
+	- Creates the console handler, the file handler is created by apply_log_settings() once config.ini is read,
+	  records logged before that wait on the queue
 	- Sets debug level
 
 	Args:
 		console_debug_lvl (str): 0 off, 1 on prints only in log file, 2 on prints to log file & console
 	"""
+	global log_queue, log_listener, log_console_handler, log_file_handler, log_settings, log_started
 	try:
-		# Log File Variables
-		log_file_dir = "logs"
-		log_file_dir = os.path.join(os.getcwd(), log_file_dir)
-		log_file_name = 'ucxn-pin-reminder'
-		log_file_ext = '.log'
-		log_file_date = datetime.datetime.now().strftime("%Y%m%d")
-		log_file_time = datetime.datetime.now().strftime("%H%M%S")
-		global log_file_fullname
-		global log_file_actual
-		log_file_fullname = (log_file_name + '-' + log_file_date + '-' + log_file_time + log_file_ext)
-		log_file_actual = os.path.join(log_file_dir, log_file_fullname)
-
 		# Create Log File directory if it does not exist
+		log_file_dir = os.path.join(os.getcwd(), "logs")
 		if not os.path.exists(log_file_dir): os.mkdir(log_file_dir)
 
-		# Global log FILE settings
-		log_file_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(module)s -> %(message)s')
-		log_file_handler   = logging.FileHandler(log_file_actual)
-		log_file_handler.setFormatter(log_file_formatter)
-
 		# Global log CONSOLE settings
 		log_console_formatter = logging.Formatter('%(asctime)s - %(message)s')
 		log_console_handler   = logging.StreamHandler()
 		log_console_handler.setFormatter(log_console_formatter)
+		set_log_levels(console_debug_lvl)
 
-		if console_debug_lvl == '2':
-			# Debug writes to log file AND displays in console
-			log_console_handler.setLevel(logging.DEBUG)
-			logger.setLevel(logging.DEBUG)
-		elif console_debug_lvl == '1':
-			# Debug only writes to log file, does not display in console
-			log_console_handler.setLevel(logging.INFO)
-			logger.setLevel(logging.DEBUG)
-		else:
-			# Debug is completely off, doesn't write to log file
-			log_console_handler.setLevel(logging.INFO)
-			logger.setLevel(logging.INFO)
-
-		# Adds configurations to global log
-		logger.addHandler(log_file_handler)
-		logger.addHandler(log_console_handler)
-
-	except IOError as e:
-		errOut = "** ERROR: Unable to create or open log file %s" % log_file_name
-		if e.errno == 2:    errOut += "- No such directory **"
-		elif e.errno == 13: errOut += " - Permission Denied **"
-		elif e.errno == 24: errOut += " - Too many open files **"
-		else:
-			errOut += " - Unhandled Exception-> %s **" % str(e)
-			sys.stderr.write(errOut + "\n")
-			traceback.print_exc()
+		log_file_handler = None
+		log_settings     = None
+		log_started      = False
+		log_queue        = queue.SimpleQueue()
+		log_listener     = logging.handlers.QueueListener(log_queue, respect_handler_level=True)
+		logger.addHandler(LogQueueHandler(log_queue))
+		atexit.register(stop_logging) # registered first so it runs last, after everything else has logged
 
 	except Exception:
 		traceback.print_exc()
 
+def set_log_levels(debug_lvl):
+	"""
+	Args:
+		debug_lvl (str): 0 off, 1 on prints only in log file, 2 on prints to log file & console
+	"""
+	if debug_lvl == '2':
+		# Debug writes to log file AND displays in console
+		log_console_handler.setLevel(logging.DEBUG)
+		logger.setLevel(logging.DEBUG)
+	elif debug_lvl == '1':
+		# Debug only writes to log file, does not display in console
+		log_console_handler.setLevel(logging.INFO)
+		logger.setLevel(logging.DEBUG)
+	else:
+		# Debug is completely off, doesn't write to log file
+		log_console_handler.setLevel(logging.INFO)
+		logger.setLevel(logging.INFO)
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+	"""
+	Puts log records on the queue unformatted, so the QueueListener thread formats the message and traceback
+	and the logging thread only creates the record. QueueHandler.prepare() would format them on the logging thread.
+
+	Args:
+		queue (queue.SimpleQueue | multiprocessing.Queue): log queue
+		pickled (bool): the queue goes to another process, the message args are merged into the message and the
+			traceback is turned into exc_text so the record can be pickled, it stays apart from the message
+	"""
+	def __init__(self, queue, pickled=False):
+		super().__init__(queue)
+		self.pickled = pickled
+
+	def prepare(self, record):
+		if not self.pickled: return record # args are formatted later, the tool only logs values that are not changed afterwards
+		record = copy.copy(record)
+		record.msg  = record.getMessage()
+		record.args = None
+		if record.exc_info:
+			if not record.exc_text: record.exc_text = logging.Formatter().formatException(record.exc_info)
+			record.exc_info = None
+		return record
+
+class JsonLogFormatter(logging.Formatter):
+	"""
+	Formats a log record as one JSON object per line, for log collectors
+
+	Keys are time, level, module and message, plus cluster for lines logged by a cluster process.
+	"""
+	def format(self, record):
+		entry = {"time": self.formatTime(record), "level": record.levelname, "module": record.module, "message": record.getMessage()}
+		if hasattr(record, "cluster"): entry["cluster"] = record.cluster
+		if record.exc_info:   entry["exception"] = self.formatException(record.exc_info)
+		elif record.exc_text: entry["exception"] = record.exc_text # formatted by the cluster process, see LogQueueHandler
+		return json.dumps(entry)
+
+def apply_log_settings(log_format="text", max_mb=0, backups=0):
+	"""
+	Creates the log file handler for the [LOGGING] settings and (re)starts the QueueListener thread
+
+	- max_mb 0 writes a new timestamped log file every run, otherwise one ucxn-pin-reminder.log rotated at max_mb
+	- Called again by the daemon when config.ini changes, the handler is only replaced if a setting changed
+
+	Args:
+		log_format (str): text or json
+		max_mb (float): rotate the log file at this size, 0 for a timestamped file per run
+		backups (int): rotated log files kept
+	"""
+	global log_file_handler, log_file_actual, log_file_fullname, log_settings, log_started
+	if log_settings == (log_format, max_mb, backups): return
+	if log_started: log_listener.stop()
+	old_handler  = log_file_handler
+	log_file_dir = os.path.join(os.getcwd(), "logs")
+	if max_mb > 0:
+		log_file_fullname = 'ucxn-pin-reminder.log'
+		log_file_actual   = os.path.join(log_file_dir, log_file_fullname)
+		log_file_handler  = logging.handlers.RotatingFileHandler(log_file_actual, maxBytes=int(max_mb*1048576), backupCount=backups, encoding="utf-8")
+	else:
+		log_file_fullname = 'ucxn-pin-reminder-' + datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + '.log'
+		log_file_actual   = os.path.join(log_file_dir, log_file_fullname)
+		log_file_handler  = logging.FileHandler(log_file_actual, encoding="utf-8")
+	if log_format == "json":
+		log_file_handler.setFormatter(JsonLogFormatter())
+	else:
+		log_file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(module)s -> %(message)s'))
+	if old_handler is not None: old_handler.close()
+	log_settings = (log_format, max_mb, backups)
+	log_listener.handlers = (log_file_handler, log_console_handler)
+	log_listener.start()
+	log_started = True
+
+def flush_log():
+	"""
+	Waits for the queued log records to be written, before the log file is read for the error email
+	"""
+	if not log_started: return
+	log_listener.stop()
+	log_listener.start()
+
+def stop_logging():
+	"""
+	Writes the queued log records and stops the listener thread at exit, with the default log file if config.ini was never read
+	"""
+	global log_started
+	if not log_started: apply_log_settings()
+	log_listener.stop()
+	log_started = False
+
+class Metrics:
+	"""
+	Thread safe run metrics
+
+	- observe() records a latency into a fixed bucket histogram along with bytes transferred
+	- count() increments a counter, e.g. errors and retries
+	- timer() is a context manager that observes how long its block took
+	Every metric has a name and an optional label, e.g. ("cupi_request", "pin").
+	"""
+	BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600) # seconds
+
+	def __init__(self):
+		self.lock       = threading.Lock()
+		self.histograms = {}
+		self.counters   = {}
+
+	def observe(self, name, seconds, label="", nbytes=0):
+		with self.lock:
+			h = self.histograms.get((name, label))
+			if h is None:
+				h = self.histograms[(name, label)] = {"buckets": [0]*(len(self.BUCKETS)+1), "count": 0, "sum": 0.0, "max": 0.0, "bytes": 0}
+			h["buckets"][bisect.bisect_left(self.BUCKETS, seconds)] += 1
+			h["count"] += 1
+			h["sum"]   += seconds
+			h["max"]    = max(h["max"], seconds)
+			h["bytes"] += nbytes
+
+	def count(self, name, label="", n=1):
+		with self.lock:
+			self.counters[(name, label)] = self.counters.get((name, label), 0) + n
+
+	def state(self):
+		"""
+		Returns:
+			(histograms, counters) (tuple): copies of the raw metrics, picklable so a cluster process can hand them back
+		"""
+		with self.lock:
+			return {k: dict(h, buckets=list(h["buckets"])) for k, h in self.histograms.items()}, dict(self.counters)
+
+	def merge(self, state):
+		"""
+		Adds the metrics from another Metrics.state() into these
+		"""
+		histograms, counters = state
+		with self.lock:
+			for k, other in histograms.items():
+				h = self.histograms.get(k)
+				if h is None:
+					self.histograms[k] = dict(other, buckets=list(other["buckets"]))
+					continue
+				h["buckets"] = [a + b for a, b in zip(h["buckets"], other["buckets"])]
+				h["count"]  += other["count"]
+				h["sum"]    += other["sum"]
+				h["max"]     = max(h["max"], other["max"])
+				h["bytes"]  += other["bytes"]
+			for k, v in counters.items():
+				self.counters[k] = self.counters.get(k, 0) + v
+
+	@contextlib.contextmanager
+	def timer(self, name, label=""):
+		time_start = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.observe(name, time.perf_counter() - time_start, label)
+
+	def percentile(self, h, q):
+		"""
+		Estimates a percentile from the histogram buckets by interpolating inside the bucket it falls in
+		"""
+		target     = q * h["count"]
+		cumulative = 0
+		for i, c in enumerate(h["buckets"]):
+			if c and cumulative + c >= target:
+				lower = self.BUCKETS[i-1] if i > 0 else 0.0
+				upper = self.BUCKETS[i] if i < len(self.BUCKETS) else h["max"]
+				return min(lower + (upper - lower) * (target - cumulative) / c, h["max"])
+			cumulative += c
+		return h["max"]
+
+	def summary(self):
+		"""
+		Returns:
+			rows (list[dict]): one row per histogram with count, p50/p95/p99/max, total seconds and bytes
+		"""
+		with self.lock:
+			rows = []
+			for (name, label), h in sorted(self.histograms.items()):
+				rows.append({
+					"name"   : name,
+					"label"  : label,
+					"count"  : h["count"],
+					"p50"    : round(self.percentile(h, 0.50), 4),
+					"p95"    : round(self.percentile(h, 0.95), 4),
+					"p99"    : round(self.percentile(h, 0.99), 4),
+					"max"    : round(h["max"], 4),
+					"total"  : round(h["sum"], 3),
+					"bytes"  : h["bytes"]
+				})
+			return rows
+
+	def to_dict(self):
+		with self.lock: counters = [{"name": n, "label": l, "value": v} for (n, l), v in sorted(self.counters.items())]
+		return {"histograms": self.summary(), "counters": counters}
+
+	def to_prometheus(self):
+		"""
+		Returns:
+			text (str): Prometheus text exposition format, for the node_exporter textfile collector
+		"""
+		lines = []
+		with self.lock:
+			for (name, label), h in sorted(self.histograms.items()):
+				metric = f"ucxn_pin_reminder_{name}_seconds"
+				cumulative = 0
+				for le, c in zip(self.BUCKETS + ("+Inf",), h["buckets"]):
+					cumulative += c
+					lines.append(f'{metric}_bucket{{label="{label}",le="{le}"}} {cumulative}')
+				lines.append(f'{metric}_sum{{label="{label}"}} {h["sum"]}')
+				lines.append(f'{metric}_count{{label="{label}"}} {h["count"]}')
+				if h["bytes"]: lines.append(f'ucxn_pin_reminder_{name}_bytes_total{{label="{label}"}} {h["bytes"]}')
+			for (name, label), v in sorted(self.counters.items()):
+				lines.append(f'ucxn_pin_reminder_{name}_total{{label="{label}"}} {v}')
+		return "\n".join(lines) + "\n"
+
+	def summary_text(self):
+		lines = [f"{'Metric':<28}{'Count':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'Total':>10}{'MB':>9}"]
+		for r in self.summary():
+			lines.append(f"{(r['name']+' '+r['label']).strip():<28}{r['count']:>8}{r['p50']:>9.3f}{r['p95']:>9.3f}{r['p99']:>9.3f}{r['total']:>10.1f}{r['bytes']/1048576:>9.2f}")
+		return "\n".join(lines)
+
+	def summary_html(self):
+		rows = ["<tr><th>Metric</th><th>Count</th><th>p50 (s)</th><th>p95 (s)</th><th>p99 (s)</th><th>Total (s)</th><th>MB</th></tr>"]
+		for r in self.summary():
+			rows.append(f"<tr><td>{(r['name']+' '+r['label']).strip()}</td><td>{r['count']}</td><td>{r['p50']:.3f}</td><td>{r['p95']:.3f}</td><td>{r['p99']:.3f}</td><td>{r['total']:.1f}</td><td>{r['bytes']/1048576:.2f}</td></tr>")
+		return "<table>" + "".join(rows) + "</table>"
+
+def write_metrics():
+	"""
+	Saves the run metrics in the logs folder as JSON, and as a Prometheus textfile if prometheus_file is configured
+	"""
+	try:
+		metrics_file = os.path.join(os.path.dirname(log_file_actual), f"ucxn-pin-reminder-{time_start:%Y%m%d-%H%M%S}.metrics.json") # one per run, also when the log file rotates
+		with open(metrics_file, "w") as f:
+			json.dump(metrics.to_dict(), f, indent=2)
+		logger.debug("Metrics saved: %s", metrics_file)
+		if cfg["prometheus_file"] != "none":
+			tmp_file = cfg["prometheus_file"] + ".tmp"
+			with open(tmp_file, "w") as f:
+				f.write(metrics.to_prometheus())
+			os.replace(tmp_file, cfg["prometheus_file"]) # atomic, the collector never reads a partial file
+			logger.debug("Prometheus metrics saved: %s", cfg['prometheus_file'])
+	except Exception as e:
+		logger.error(f"Error: metrics were not saved: {e} on line {sys.exc_info()[2].tb_lineno}")
+
+class AdaptiveLimiter:
+	"""
+	Limits how many CUPI requests are in flight across all worker threads (AIMD)
+
+	- Starts at max_limit, a throttled request (429, 503 or a timeout) halves the limit, at most once per
+	  second so a burst of failures from the same round only counts once
+	- Successful requests grow the limit back by 1, at most once per second so it creeps up to the
+	  concurrency the server accepts instead of straight back into throttling
+	- Never drops below 1, so a struggling server still sees one request at a time
+	"""
+	def __init__(self, max_limit):
+		self.max_limit     = max_limit
+		self.limit         = max_limit
+		self.in_flight     = 0
+		self.last_decrease = 0.0
+		self.last_increase = 0.0
+		self.cond          = threading.Condition()
+
+	def acquire(self):
+		with self.cond:
+			while self.in_flight >= self.limit:
+				self.cond.wait()
+			self.in_flight += 1
+
+	def release(self, throttled=False):
+		with self.cond:
+			self.in_flight -= 1
+			now = time.monotonic()
+			if throttled:
+				if now - self.last_decrease >= 1:
+					self.last_decrease = now
+					self.limit = max(1, self.limit // 2)
+					logger.debug("CUPI throttled, concurrency limit lowered to %s", self.limit)
+			elif self.limit < self.max_limit and now - max(self.last_decrease, self.last_increase) >= 1:
+				self.last_increase = now
+				self.limit += 1
+			self.cond.notify_all()
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+THROTTLE_STATUS_CODES = (429, 503)
+
+def retry_after_seconds(response):
+	"""
+	Returns:
+		seconds (float): from the Retry-After header, seconds or an http date, None if missing or invalid
+	"""
+	from email.utils import parsedate_to_datetime
+	value = response.headers.get("Retry-After")
+	if value is None: return None
+	try:
+		return max(0.0, float(value))
+	except ValueError:
+		pass
+	try:
+		return max(0.0, (parsedate_to_datetime(value) - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+	except (TypeError, ValueError):
+		return None
+
+def ucxn_get(url, endpoint):
+	"""
+	GETs a UCXN url through ucxn_session and records its latency, size and errors
+
+	- Every request has a timeout and passes through the adaptive concurrency limiter
+	- Timeouts, connection errors and 429/5xx responses are retried up to max_retries times
+	- Waits the Retry-After header if the server sent one, otherwise exponential backoff with full jitter
+	- The last response is returned once retries run out, callers still check status_code
+
+	Args:
+		url (str): full url
+		endpoint (str): metrics label for the kind of request
+
+	Returns:
+		response (requests.Response)
+	"""
+	import requests
+	attempt = 0
+	while True:
+		logger.debug("GET = %s", url)
+		cupi_limiter.acquire()
+		throttled  = False
+		time_start = time.perf_counter()
+		try:
+			response = ucxn_session.get(url, timeout=cfg["request_timeout"])
+		except (requests.Timeout, requests.ConnectionError) as e:
+			throttled = isinstance(e, requests.Timeout)
+			metrics.count("cupi_request_errors", endpoint)
+			if attempt >= cfg["max_retries"]: raise
+			wait = None
+			logger.debug("GET failed: %s", e)
+		except Exception:
+			metrics.count("cupi_request_errors", endpoint)
+			raise
+		else:
+			body = response.content # reads the body, raw.tell() is then the bytes on the wire, before gzip decoding
+			metrics.observe("cupi_request", time.perf_counter() - time_start, endpoint, response.raw.tell() if hasattr(response.raw, "tell") else len(body))
+			if response.status_code == 200: return response
+			metrics.count("cupi_request_errors", endpoint)
+			throttled = response.status_code in THROTTLE_STATUS_CODES
+			if response.status_code not in RETRY_STATUS_CODES or attempt >= cfg["max_retries"]: return response
+			wait = retry_after_seconds(response)
+			logger.debug("GET returned %s %s", response.status_code, response.reason)
+		finally:
+			cupi_limiter.release(throttled)
+
+		if wait is None: wait = random.uniform(0, min(cfg["backoff_max"], 0.5 * 2 ** attempt))
+		wait = min(wait, cfg["backoff_max"])
+		attempt += 1
+		metrics.count("cupi_retries", endpoint)
+		logger.debug("Retrying in %.2f seconds, attempt %s of %s", wait, attempt, cfg['max_retries'])
+		time.sleep(wait)
+
+PIN_FIELDS  = ("CredentialPolicyObjectId", "DoesntExpire", "CredMustChange", "TimeChanged")
+USER_FIELDS = ("LdapType",)
+json_decode = None
+
+def response_json(response, fields=None):
+	"""
+	Decodes a CUPI response body, with orjson when it is installed, it is several times faster than json on large pages
+
+	Args:
+		response (requests.Response)
+		fields (tuple[str]): keep only these keys, so only what the tool uses is held in flight and written to the checkpoint, None keeps all
+
+	Returns:
+		resp_json (dict)
+	"""
+	global json_decode
+	if json_decode is None:
+		try:
+			import orjson
+			json_decode = orjson.loads
+		except ImportError:
+			json_decode = json.loads
+	resp_json = json_decode(response.content)
+	if fields is None: return resp_json
+	return {k: resp_json[k] for k in fields if k in resp_json}
+
 def get_auth_rules():
 	"""
 	GETs auth rules from UCXN
@@ -228,10 +691,9 @@ def get_auth_rules():
 	"""
 	try:
 		url       = f"{cfg['base_url']}/vmrest/authenticationrules"
-		logger.debug(f"GET = {url}")
-		response  = ucxn_session.get(url)
+		response  = ucxn_get(url, "authrules")
 		if response.status_code != 200: raise Exception(f"Unexpected response from UCXN. Status Code: {response.status_code} Reason: {response.reason}")
-		resp_json = response.json()
+		resp_json = response_json(response)
 
 		authrules = []
 		for r in resp_json["AuthenticationRule"]:
@@ -240,229 +702,1264 @@ def get_auth_rules():
 				"DisplayName": r["DisplayName"],
 				"MaxDays"    : r["MaxDays"]
 			})
-		logger.debug(f"authrules = {authrules}")
+		logger.debug("authrules = %s", authrules)
+		global authrule_index
+		authrule_index = {r["ObjectId"]: (r["DisplayName"], int(r["MaxDays"])) for r in authrules} # CredentialPolicyObjectId lookups
 		return authrules
 	except Exception as e:
 		logger.error(f"Error: {e} on line {sys.exc_info()[2].tb_lineno}")
 		send_admin_email_error()
 		sys.exit(1)
 
+class MailboxRecord:
+	"""
+	A single mailbox and its PIN data
+
+	Slotted to keep per mailbox memory low on large systems. Flags are real bools, day counts are ints and dates are
+	datetime.date, REPORT_COLUMNS maps the attributes to the report column names. Attributes that have not been
+	fetched yet, or could not be because of an error, are None.
+	"""
+	__slots__ = (
+		"object_id", "alias", "display_name", "extension", "email_address", "creation_time", "self_enrollment", "ldap",
+		"auth_rule", "expiration_days", "pin_doesnt_expire", "pin_must_change", "date_last_changed", "expiration_date",
+		"days_until_expired", "expiration_email_sent", "from_cache", "cluster"
+	)
+
+	def __init__(self, object_id, alias, display_name, extension, email_address, creation_time, self_enrollment, ldap=None):
+		self.object_id             = object_id
+		self.alias                 = alias
+		self.display_name          = display_name
+		self.extension             = extension
+		self.email_address         = email_address
+		self.creation_time         = creation_time
+		self.self_enrollment       = self_enrollment
+		self.ldap                  = ldap
+		self.auth_rule             = None
+		self.expiration_days       = None
+		self.pin_doesnt_expire     = None
+		self.pin_must_change       = None
+		self.date_last_changed     = None
+		self.expiration_date       = None
+		self.days_until_expired    = None
+		self.expiration_email_sent = None
+		self.from_cache            = None
+		self.cluster               = None
+
+# (report column, MailboxRecord attribute)
+REPORT_COLUMNS = [
+	("Alias",                 "alias"),
+	("Display Name",          "display_name"),
+	("Extension",             "extension"),
+	("Email Address",         "email_address"),
+	("Creation Time",         "creation_time"),
+	("Self Enrollment",       "self_enrollment"),
+	("LDAP",                  "ldap"),
+	("Auth Rule",             "auth_rule"),
+	("Expiration Days",       "expiration_days"),
+	("PIN Doesnt Expire",     "pin_doesnt_expire"),
+	("PIN Must Change",       "pin_must_change"),
+	("Date Last Changed",     "date_last_changed"),
+	("Expiration Date",       "expiration_date"),
+	("Days Until Expired",    "days_until_expired"),
+	("Expiration Email Sent", "expiration_email_sent"),
+	("From Cache",            "from_cache"),
+	("Cluster",               "cluster")
+]
+
+def get_mailbox_page(pageNumber):
+	"""
+	GETs a single page of mailboxes
+
+	Args:
+		pageNumber (int): page to GET, starting at 1
+
+	Returns:
+		mailboxes (list[MailboxRecord]): each mailbox on the page
+	"""
+	url       = f"{cfg['base_url']}/vmrest/users?rowsPerPage={cfg['rows_per_page']}&pageNumber={pageNumber}{user_query_param()}"
+	response  = ucxn_get(url, "users_page")
+	if response.status_code != 200: raise Exception(f"Unexpected response from UCXN. Status Code: {response.status_code} Reason: {response.reason}")
+	resp_json = response_json(response)
+
+	# If only a single user is returned the UCXN response User object will be a dict instead of a list
+	if type(resp_json["User"]) == list:
+		users = resp_json["User"]
+	elif type(resp_json["User"]) == dict:
+		users = [resp_json["User"]]
+	else:
+		raise Exception(f"Unexpected response from UCXN. The User object is neither a list or a dict.")
+
+	mailboxes = []
+	for m in users:
+		# Saves a GET per mailbox in get_pin_data, servers that leave LdapType out of the list fall back to the per user GET
+		ldap = None
+		if cfg["ldap_lookup"] == "list" and "LdapType" in m: ldap = m["LdapType"] == "3"
+		mailboxes.append(MailboxRecord(
+			object_id       = m["ObjectId"],
+			alias           = m["Alias"],
+			display_name    = m["DisplayName"],
+			extension       = m["DtmfAccessId"],
+			email_address   = m.get("EmailAddress", ""),
+			creation_time   = m["CreationTime"][:10],
+			self_enrollment = m["IsVmEnrolled"] == "true",
+			ldap            = ldap
+		))
+	return mailboxes
+
+def user_query_param():
+	"""
+	Returns:
+		param (str): the user_query filter as a CUPI query= parameter for the mailbox list, empty if not configured
+	"""
+	if cfg["user_query"] == "none": return ""
+	return "&query=" + urllib.parse.quote(cfg["user_query"])
+
+def get_mailbox_total():
+	"""
+	GETs the total number of mailboxes
+
+	- Calculates how many GETs required to list all mailboxes at rows_per_page per page
+
+	Returns:
+		total_pages (int)
+	"""
+	url       = f"{cfg['base_url']}/vmrest/users?rowsPerPage=0{user_query_param()}"
+	response  = ucxn_get(url, "users_total")
+	if response.status_code != 200: raise Exception(f"Unexpected response from UCXN. Status Code: {response.status_code} Reason: {response.reason}")
+	resp_json = response_json(response)
+	global total_mailboxes
+	total_mailboxes = resp_json['@total']
+	logger.debug("Total Mailboxes = %s", total_mailboxes)
+	total_pages = math.ceil(int(total_mailboxes) / cfg["rows_per_page"])
+	logger.debug("Total Pages = %s (with %s rows per page)", total_pages, cfg['rows_per_page'])
+	return total_pages
+
+def iter_mailbox_pages(total_pages):
+	"""
+	GETs up to page_workers pages of mailboxes concurrently
+
+	Args:
+		total_pages (int): from get_mailbox_total()
+
+	Yields:
+		page (list): mailboxes on each page, in page order
+	"""
+	logger.debug("Starting page loop")
+	yield from ordered_map(get_mailbox_page, range(1, total_pages+1), cfg["page_workers"])
+
 def get_mailboxes():
 	"""
 	GETs list of mailboxes
 
 	- Initial GET returns total number of mailboxes
-	- Calculates how many GETs required to list all mailboxes at 100 per page
-	- Performs GET pagination loop
+	- GETs every page, results are merged back in page order
 
 	If successful, returns response as a list. Otherwise raise an exception.
 
 	Returns:
-		mailboxes (list): with each mailbox as a dict
+		mailboxes (list[MailboxRecord])
 	"""
 	try:
-		url       = f"{cfg['base_url']}/vmrest/users?rowsPerPage=0"
-		logger.debug(f"GET = {url}")
-		response  = ucxn_session.get(url)
-		if response.status_code != 200: raise Exception(f"Unexpected response from UCXN. Status Code: {response.status_code} Reason: {response.reason}")
-		resp_json = response.json()
-		global total_mailboxes
-		total_mailboxes = resp_json['@total']
-		logger.debug(f"Total Mailboxes = {total_mailboxes}")
-		rowsPerPage = 100
-		total_pages = math.ceil(int(total_mailboxes) / rowsPerPage)
-		logger.debug(f"Total Pages = {total_pages} (with {rowsPerPage} rows per page)")
-		logger.debug("Starting page loop")
-
+		total_pages = get_mailbox_total()
 		mailboxes = []
-		for pageNumber in tqdm(range(total_pages)):
-			url       = f"{cfg['base_url']}/vmrest/users?rowsPerPage={rowsPerPage}&pageNumber={pageNumber+1}"
-			logger.debug(f"GET = {url}")
-			response  = ucxn_session.get(url)
-			if response.status_code != 200: raise Exception(f"Unexpected response from UCXN. Status Code: {response.status_code} Reason: {response.reason}")
-			resp_json = response.json()
-
-			# If only a single user is returned the UCXN response User object will be a dict instead of a list
-			if type(resp_json["User"]) == list:
-				for m in resp_json["User"]:
-					mailboxes.append({
-						"ObjectId"       : m["ObjectId"],
-						"Alias"          : m["Alias"],
-						"Display Name"   : m["DisplayName"],
-						"Extension"      : m["DtmfAccessId"],
-						"Email Address"  : m.get("EmailAddress", ""),
-						"Creation Time"  : m["CreationTime"][:10],
-						"Self Enrollment": m["IsVmEnrolled"]
-					})
-			elif type(resp_json["User"]) == dict:
-				mailboxes.append({
-					"ObjectId"       : resp_json["User"]["ObjectId"],
-					"Alias"          : resp_json["User"]["Alias"],
-					"Display Name"   : resp_json["User"]["DisplayName"],
-					"Extension"      : resp_json["User"]["DtmfAccessId"],
-					"Email Address"  : resp_json["User"].get("EmailAddress", ""),
-					"Creation Time"  : resp_json["User"]["CreationTime"][:10],
-					"Self Enrollment": resp_json["User"]["IsVmEnrolled"]
-				})
-			else:
-				raise Exception(f"Unexpected response from UCXN. The User object is neither a list or a dict.")
+		for page in progress_bar(iter_mailbox_pages(total_pages), total=total_pages):
+			mailboxes.extend(page)
 		return mailboxes
 	except Exception as e:
 		logger.error(f"Error: {e} on line {sys.exc_info()[2].tb_lineno}")
 		send_admin_email_error()
 		sys.exit(1)
 
-def get_pin_data():
+def progress_bar(iterable=None, total=None):
+	"""
+	Returns:
+		progress (tqdm): console progress bar over iterable, hidden in cluster processes and daemon mode
 	"""
-	GETs the mailbox PIN data
+	from tqdm import tqdm
+	return tqdm(iterable, total=total, disable=not show_progress)
 
-	- Performs individual GETs for each mailbox to get the PIN data
-	- Caclulates PIN expiration dates
+def ordered_map(func, iterable, workers):
+	"""
+	Runs func against every item of iterable using a pool of worker threads
+
+	- Results are yielded in the same order as iterable
+	- At most workers*2 items are in flight so memory stays bounded
+	- With a single worker func runs inline without a thread pool
+
+	Args:
+		func (function): called with one item, must be thread safe
+		iterable (iterable): items to process
+		workers (int): max number of concurrent threads
+
+	Yields:
+		result of func(item) for each item
+	"""
+	if workers <= 1:
+		for item in iterable: yield func(item)
+		return
+	with ThreadPoolExecutor(max_workers=workers) as executor:
+		pending = collections.deque()
+		for item in iterable:
+			pending.append(executor.submit(func, item))
+			if len(pending) >= workers*2: yield pending.popleft().result()
+		while pending: yield pending.popleft().result()
+
+class PinCache:
+	"""
+	On disk SQLite store of the PIN data fetched on previous runs, keyed by mailbox ObjectId
 
-	If successful, returns updated mailboxes (list[dict]). Otherwise raise an exception.
+	Lets a run skip the PIN GET for mailboxes that cannot reach an email interval before the cached record is refreshed.
+
+	Args:
+		file_fqdn (str): SQLite database file
+	"""
+	def __init__(self, file_fqdn):
+		import sqlite3
+		self.conn = sqlite3.connect(file_fqdn)
+		self.conn.execute("""
+			CREATE TABLE IF NOT EXISTS pin_cache (
+				object_id                  TEXT PRIMARY KEY,
+				time_changed               TEXT,
+				credential_policy_objectid TEXT,
+				doesnt_expire              TEXT,
+				cred_must_change           TEXT,
+				ldap                       TEXT,
+				fetched_at                 TEXT
+			)""")
+
+	def load(self):
+		"""
+		Returns:
+			rows (dict): cached PIN data as {ObjectId: dict}, using the same keys as the UCXN credential/pin response
+		"""
+		rows = {}
+		for r in self.conn.execute("SELECT * FROM pin_cache"):
+			rows[r[0]] = {
+				"TimeChanged"             : r[1],
+				"CredentialPolicyObjectId": r[2],
+				"DoesntExpire"            : r[3],
+				"CredMustChange"          : r[4],
+				"LDAP"                    : r[5],
+				"FetchedAt"               : datetime.datetime.fromisoformat(r[6])
+			}
+		return rows
+
+	def save(self, object_id, pin_json, ldap):
+		self.conn.execute(
+			"INSERT OR REPLACE INTO pin_cache VALUES (?, ?, ?, ?, ?, ?, ?)",
+			(object_id, pin_json["TimeChanged"], pin_json["CredentialPolicyObjectId"], pin_json["DoesntExpire"], pin_json["CredMustChange"], "true" if ldap else "false", today.isoformat())
+		)
+
+	def close(self, max_age_days):
+		"""
+		Removes records no run has refreshed in 2x max_age_days (deleted mailboxes), commits and closes
+		"""
+		self.conn.execute("DELETE FROM pin_cache WHERE fetched_at < ?", ((today - datetime.timedelta(days=max_age_days*2)).isoformat(),))
+		self.conn.commit()
+		self.conn.close()
+
+def cached_pin_usable(c):
+	"""
+	Checks if a cached PIN record can be used instead of a GET
 
+	The record must be younger than max_age_days and the PIN must either never expire, or expire
+	further out than the largest email interval. A PIN change only pushes the expiration further out,
+	so these mailboxes cannot be due a reminder until their cached expiration reaches an interval.
+
+	Args:
+		c (dict): cached PIN record from PinCache.load()
+
+	Returns:
+		bool
+	"""
+	if (today - c["FetchedAt"]).days >= cfg["cache_max_age_days"]: return False
+	rule = authrule_index.get(c["CredentialPolicyObjectId"])
+	if rule is None: return False # auth rule no longer exists
+	if rule[1] == 0 or c["DoesntExpire"] == "true": return True
+	time_changed = datetime.datetime.fromisoformat(c["TimeChanged"])
+	days_until_expired = (time_changed + datetime.timedelta(days=rule[1]) - today).days
+	return days_until_expired > max(cfg["email_intervals"])
+
+class Checkpoint:
+	"""
+	Append only NDJSON record of the PIN data fetched and the reminders sent by the current run, so -resume can finish an interrupted run
+
+	- A run line starts the file, pin lines are appended a batch at a time and sent lines as each reminder is sent
+	- Synced to disk after every batch, an interrupted run only loses the batch in flight
+	- resume loads the checkpoint left by an interrupted run from today and appends to it, otherwise a new one is started
+	- Removed once the run finishes
+
+	Args:
+		file_fqdn (str): NDJSON file
+		resume (bool): continue the existing checkpoint
+	"""
+	def __init__(self, file_fqdn, resume=False):
+		self.file_fqdn = file_fqdn
+		self.rows      = {}    # ObjectId: pin line from the interrupted run
+		self.sent      = set() # ObjectId of the reminders the interrupted run sent
+		self.lines     = []
+		resumed = resume and self.load()
+		self.file = open(file_fqdn, "a" if resumed else "w", encoding="utf-8")
+		if resumed:
+			self.file.write("\n") # the interrupted run may have stopped part way through a line, it is skipped by load()
+		else:
+			self.lines.append(json.dumps({"type": "run", "day": today.date().isoformat(), "started": time_start.isoformat(timespec="seconds")}))
+			self.flush()
+
+	def load(self):
+		"""
+		Returns:
+			resumed (bool): the checkpoint exists and is from today
+		"""
+		if not os.path.isfile(self.file_fqdn):
+			logger.info("No checkpoint to resume, starting a new run")
+			return False
+		with open(self.file_fqdn, "r", encoding="utf-8") as f:
+			for line in f:
+				try:
+					r = json.loads(line)
+				except ValueError:
+					continue
+				if r["type"] == "run" and r["day"] != today.date().isoformat():
+					logger.info(f"The checkpoint is from {r['day']}, starting a new run")
+					return False
+				elif r["type"] == "pin":
+					self.rows[r["id"]] = r
+				elif r["type"] == "sent":
+					self.sent.add(r["id"])
+		logger.info(f"Resuming from the checkpoint, {len(self.rows)} PIN records and {len(self.sent)} reminders sent")
+		return True
+
+	def pin(self, object_id, pin_json, ldap):
+		"""
+		Queues a fetched PIN record for the next flush(), records loaded from the checkpoint are not written again
+		"""
+		if object_id in self.rows: return
+		self.lines.append(json.dumps({"type": "pin", "id": object_id, "pin": pin_json, "ldap": ldap}))
+
+	def sent_to(self, object_id):
+		self.file.write(json.dumps({"type": "sent", "id": object_id}) + "\n")
+		self.file.flush()
+
+	def flush(self):
+		if self.lines: self.file.write("\n".join(self.lines) + "\n")
+		self.lines = []
+		self.file.flush()
+		os.fsync(self.file.fileno())
+
+	def close(self, finished):
+		"""
+		Args:
+			finished (bool): the run finished, the checkpoint is removed
+		"""
+		try:
+			self.flush()
+		finally:
+			self.file.close()
+		if finished: os.remove(self.file_fqdn)
+
+class SentLog:
+	"""
+	Append only NDJSON record of the reminders sent today, kept between runs so a mailbox gets at most one reminder a day,
+	e.g. from a scheduled -reminders run followed by the report run, or a daemon restarted during the day
+
+	- Loaded at the start of every run, the file is rewritten with only today's lines
+	- A line is appended and flushed as each reminder is sent
+
+	Args:
+		file_fqdn (str): NDJSON file
+	"""
+	def __init__(self, file_fqdn):
+		self.day  = today.date().isoformat()
+		self.sent = set() # ObjectId of the reminders sent today
+		if os.path.isfile(file_fqdn):
+			with open(file_fqdn, "r", encoding="utf-8") as f:
+				for line in f:
+					try:
+						r = json.loads(line)
+					except ValueError:
+						continue # a run stopped part way through a line
+					if r["day"] == self.day: self.sent.add(r["id"])
+		with open(file_fqdn + ".tmp", "w", encoding="utf-8") as f:
+			for object_id in self.sent: f.write(json.dumps({"id": object_id, "day": self.day}) + "\n")
+		os.replace(file_fqdn + ".tmp", file_fqdn)
+		self.file = open(file_fqdn, "a", encoding="utf-8")
+
+	def add(self, object_id):
+		self.file.write(json.dumps({"id": object_id, "day": self.day}) + "\n")
+		self.file.flush()
+
+	def close(self):
+		self.file.close()
+
+def cluster_file(name, prefix, ext):
+	"""
 	Returns:
-		mailboxes (dict)
+		file_fqdn (str): per cluster file in the data folder, e.g. data/pin_cache-<name>.db
+	"""
+	return os.path.join(cfg["data_folder_name"], prefix + "-" + re.sub(r"[^\w.-]", "_", name) + ext)
+
+def reminder_candidate(m):
+	"""
+	Checks if a mailbox could be due a reminder today, the reminder job only gets the PIN data for these
+
+	- Mailboxes without an email address are never sent a reminder
+	- Mailboxes without a recent cached PIN record, or whose auth rule is unknown, are always candidates
+	- A cached PIN that never expires, or is on an auth rule with MaxDays 0, is not a candidate
+	- A cached PIN whose days until expired matches an email interval is a candidate
+	- Any other cached PIN is only a candidate if a change since it was cached could land it on an interval,
+	  a PIN changed after the record was fetched expires no sooner than MaxDays after the fetch, counted in
+	  days until expired the same way as process_pin_batch()
+
+	Args:
+		m (MailboxRecord): mailbox
+
+	Returns:
+		bool
+	"""
+	if m.email_address == "": return False
+	c = pin_cache_rows.get(m.object_id)
+	if c is None: return True
+	age  = (today - c["FetchedAt"]).days
+	rule = authrule_index.get(c["CredentialPolicyObjectId"])
+	if age >= cfg["cache_max_age_days"] or rule is None: return True
+	if rule[1] == 0 or c["DoesntExpire"] == "true": return False
+	time_changed = datetime.datetime.fromisoformat(c["TimeChanged"])
+	days_until_expired = (time_changed + datetime.timedelta(days=rule[1]) - today).days
+	if days_until_expired in cfg["email_intervals"]: return True
+	return (c["FetchedAt"] + datetime.timedelta(days=rule[1]) - today).days <= max(cfg["email_intervals"])
+
+def fetch_pin_data(m):
+	"""
+	GETs the PIN data for a single mailbox
+
+	- Uses the PIN record from the checkpoint of an interrupted run when resuming
+	- Uses the PIN cache instead when the cached record is usable, see cached_pin_usable()
+	- The user GET is only performed when the LDAP status was not already taken from the mailbox list
+	- Runs inside the worker threads, it only reads from the mailbox and never touches the shared counters
+
+	Args:
+		m (MailboxRecord): mailbox
+
+	Returns:
+		(m, pin_resp) (tuple): pin_resp is (user_json, pin_json, from_cache), user_json is None if the user GET was skipped. pin_resp is None if an error occurred
+	"""
+	try:
+		logger.debug("Mailbox Alias = %s", m.alias)
+		r = checkpoint.rows.get(m.object_id)
+		if r is not None: # fetched today before the run was interrupted
+			user_json = None if m.ldap is not None else {"LdapType": "3" if r["ldap"] else "0"}
+			return m, (user_json, r["pin"], False)
+
+		c = pin_cache_rows.get(m.object_id)
+		if c is not None and cached_pin_usable(c):
+			user_json = None if m.ldap is not None else {"LdapType": "3" if c["LDAP"] == "true" else "0"}
+			return m, (user_json, c, True)
+
+		user_json = None
+		if m.ldap is None:
+			url       = f"{cfg['base_url']}/vmrest/users/{m.object_id}"
+			response  = ucxn_get(url, "user")
+			if response.status_code != 200: raise Exception(f"Unexpected response from UCXN. Status Code: {response.status_code} Reason: {response.reason}")
+			user_json = response_json(response, USER_FIELDS)
+
+		url       = f"{cfg['base_url']}/vmrest/users/{m.object_id}/credential/pin"
+		response  = ucxn_get(url, "pin")
+		if response.status_code != 200: raise Exception(f"Unexpected response from UCXN. Status Code: {response.status_code} Reason: {response.reason}")
+		pin_json  = response_json(response, PIN_FIELDS)
+
+		return m, (user_json, pin_json, False)
+	except Exception as e:
+		logger.error(f"Error: {m.alias}: {e} on line {sys.exc_info()[2].tb_lineno}")
+		return m, None
+
+def process_pin_batch(batch):
+	"""
+	Caclulates PIN expiration dates for a batch of mailboxes and tallies the stats
+
+	The auth rule join is a dict lookup and the date math runs once over the whole batch as NumPy
+	datetime64 arrays, rather than a strptime and timedelta per mailbox.
+
+	Args:
+		batch (list[tuple]): (m, user_json, pin_json, from_cache) per mailbox, see fetch_pin_data(). The mailboxes are updated in place
+
+	Raises:
+		KeyError: a CredentialPolicyObjectId does not match any auth rule
 	"""
 	global mailboxes_with_exp_days
 	global mailboxes_without_exp_days
 	global total_expired_pins
 	global total_24hr_pin_changes
-	for m in tqdm(mailboxes):
+	if not batch: return
+	import numpy as np
+
+	rules           = [authrule_index[pin_json["CredentialPolicyObjectId"]] for _, _, pin_json, _ in batch]
+	max_days        = np.fromiter((r[1] for r in rules), dtype=np.int64, count=len(batch))
+	doesnt_expire   = np.fromiter((pin_json["DoesntExpire"] == "true" for _, _, pin_json, _ in batch), dtype=bool, count=len(batch))
+	time_changed    = np.array([pin_json["TimeChanged"] for _, _, pin_json, _ in batch], dtype="datetime64[ms]")
+	expiration_date = time_changed + max_days.astype("timedelta64[D]")
+	no_expiration   = (max_days == 0) | doesnt_expire
+	days_until      = np.where(no_expiration, 0, (expiration_date - np.datetime64(today, "ms")) // np.timedelta64(1, "D"))
+	changed_day     = time_changed.astype("datetime64[D]")
+
+	for (m, user_json, pin_json, from_cache), rule, days, changed, expires, never in zip(
+		batch, rules, days_until.tolist(), changed_day.tolist(), expiration_date.astype("datetime64[D]").tolist(), doesnt_expire.tolist()
+	):
+		if user_json is not None: m.ldap = user_json["LdapType"] == "3"
+		m.auth_rule             = rule[0]
+		m.expiration_days       = rule[1]
+		m.pin_doesnt_expire     = never
+		m.pin_must_change       = pin_json["CredMustChange"] == "true"
+		m.date_last_changed     = changed
+		m.expiration_date       = expires
+		m.days_until_expired    = days
+		m.expiration_email_sent = reminders_sent.get(m.object_id) == today.date() # sent earlier today by another run, a daemon job or an interrupted run
+		if cfg["cache_enabled"]: m.from_cache = from_cache
+
+	mailboxes_without_exp_days += int(no_expiration.sum())
+	mailboxes_with_exp_days    += int((~no_expiration).sum())
+	total_expired_pins         += int((~no_expiration & (days_until <= 0)).sum())
+	total_24hr_pin_changes     += int((changed_day >= np.datetime64(today.date(), "D")).sum())
+
+def iter_pin_data(mailbox_iter):
+	"""
+	GETs the mailbox PIN data as mailboxes arrive
+
+	- Loads the PIN cache when enabled, unless -full was used
+	- Fetches the PIN data for up to pin_workers mailboxes concurrently
+	- Caclulates PIN expiration dates a batch of rows_per_page mailboxes at a time, see process_pin_batch()
+	- Yields in mailbox order, so the report order matches the mailbox list
+	- Saves freshly fetched PIN data back to the cache, and to the checkpoint after every batch
+
+	Args:
+		mailbox_iter (iterable): mailboxes, consumed lazily
+
+	Yields:
+		m (MailboxRecord): mailbox with PIN data, or Auth Rule ERROR
+	"""
+	global pin_cache_rows
+	pin_cache = None
+	if cfg["cache_enabled"]:
+		pin_cache = PinCache(cfg["cache_file_fqdn"])
+		if not full_refresh: pin_cache_rows = pin_cache.load()
+		logger.debug("PIN cache records loaded = %s", len(pin_cache_rows))
+
+	total_from_cache = 0
+	pending          = [] # (m, pin_resp) in mailbox order, waiting for their batch to be processed
+
+	def flush():
+		"""
+		Processes the pending batch, falling back to one mailbox at a time to isolate a bad record
+		"""
+		global total_mailbox_errors
+		nonlocal total_from_cache
+		batch = [(m, *pin_resp) for m, pin_resp in pending if pin_resp is not None]
 		try:
-			logger.debug(f"Mailbox Alias = {m['Alias']}")
-			url       = f"{cfg['base_url']}/vmrest/users/{m['ObjectId']}"
-			logger.debug(f"GET = {url}")
-			response  = ucxn_session.get(url)
-			if response.status_code != 200: raise Exception(f"Unexpected response from UCXN. Status Code: {response.status_code} Reason: {response.reason}")
-			resp_json = response.json()
-			
-			if resp_json["LdapType"] == "3":
-				m["LDAP"] = "true"
-			else:
-				m["LDAP"] = "false"
+			process_pin_batch(batch)
+		except Exception:
+			for item in batch:
+				try:
+					process_pin_batch([item])
+				except Exception as e:
+					logger.error(f"Error: {item[0].alias}: {type(e).__name__} {e} on line {sys.exc_info()[2].tb_lineno}")
+					item[0].auth_rule = "ERROR"
+					total_mailbox_errors += 1
+		for m, pin_resp in pending:
+			if pin_resp is None: # error was logged by fetch_pin_data
+				m.auth_rule = "ERROR"
+				total_mailbox_errors += 1
+			elif m.auth_rule != "ERROR":
+				if pin_resp[2]:
+					total_from_cache += 1
+				else:
+					checkpoint.pin(m.object_id, pin_resp[1], m.ldap)
+					if pin_cache is not None: pin_cache.save(m.object_id, pin_resp[1], m.ldap)
+		checkpoint.flush()
+		done = [m for m, _ in pending]
+		pending.clear()
+		return done
 
-			url       = f"{cfg['base_url']}/vmrest/users/{m['ObjectId']}/credential/pin"
-			logger.debug(f"GET = {url}")
-			response  = ucxn_session.get(url)
-			if response.status_code != 200: raise Exception(f"Unexpected response from UCXN. Status Code: {response.status_code} Reason: {response.reason}")
-			resp_json = response.json()
-
-			for r in authrules:
-				if resp_json["CredentialPolicyObjectId"] == r["ObjectId"]:
-					m["Auth Rule"]       = r["DisplayName"]
-					m["Expiration Days"] = r["MaxDays"]
-					break
-			m["PIN Doesnt Expire"]     = resp_json["DoesntExpire"]
-			m["PIN Must Change"]       = resp_json["CredMustChange"]
-			m["Date Last Changed"]     = datetime.datetime.strptime(resp_json["TimeChanged"], "%Y-%m-%d %H:%M:%S.%f")
-			m["Expiration Date"]       = m["Date Last Changed"] + datetime.timedelta(days=int(m["Expiration Days"]))
-			if m["Expiration Days"] == "0" or m["PIN Doesnt Expire"] == "true":
-				mailboxes_without_exp_days += 1
-				m["Days Until Expired"] = 0
-			else:
-				mailboxes_with_exp_days += 1
-				m["Days Until Expired"] = m["Expiration Date"] - today
-				m["Days Until Expired"] = m["Days Until Expired"].days
-				if m["Days Until Expired"] <= 0: total_expired_pins += 1
-			m["Date Last Changed"]     = m["Date Last Changed"].date() # Convert datetime to date
-			m["Expiration Date"]       = m["Expiration Date"].date()   # Convert datetime to date
-			m["Expiration Email Sent"] = "false"
-			if (today.date() - m["Date Last Changed"]).days < 1: total_24hr_pin_changes += 1
-		except Exception as e:
-			logger.error(f"Error: {e} on line {sys.exc_info()[2].tb_lineno}")
-			m["Auth Rule"] = "ERROR"
-			global total_mailbox_errors
-			total_mailbox_errors += 1
-	
+	try:
+		for item in ordered_map(fetch_pin_data, mailbox_iter, cfg["pin_workers"]):
+			pending.append(item)
+			if len(pending) >= cfg["rows_per_page"]: yield from flush()
+		yield from flush()
+	finally:
+		if pin_cache is not None:
+			pin_cache.close(cfg["cache_max_age_days"])
+			logger.debug("PIN data from cache = %s", total_from_cache)
+
+def get_pin_data():
+	"""
+	GETs the mailbox PIN data for every mailbox in mailboxes
+
+	The reminder job only gets the PIN data for mailboxes that could be due a reminder today, see reminder_candidate(),
+	the others are left without PIN data. None are when no auth rule expires.
+
+	If successful, returns updated mailboxes (list[MailboxRecord]). Otherwise raise an exception.
+
+	Returns:
+		mailboxes (list[MailboxRecord])
+	"""
+	if not reminders_only:
+		for m in progress_bar(iter_pin_data(mailboxes), total=len(mailboxes)): pass
+		return mailboxes
+
+	if all(rule[1] == 0 for rule in authrule_index.values()):
+		logger.info("No auth rule has expiration days, no mailbox can be due a reminder")
+		return mailboxes
+	if not cfg["cache_enabled"] or full_refresh: logger.info("The PIN cache is not in use, the reminder job gets the PIN data for every mailbox with an email address")
+	candidates = 0
+	for m in progress_bar(iter_pin_data(m for m in mailboxes if reminder_candidate(m))): candidates += 1 # filtered lazily, after iter_pin_data loads the cache
+	metrics.count("reminder_job_skipped", n=len(mailboxes) - candidates)
+	logger.info(f"PIN data for {candidates} of {len(mailboxes)} mailboxes, the rest cannot be due a reminder today")
 	return mailboxes
 
-def send_user_email():
+def init_ucxn_session():
+	"""
+	Creates the UCXN session and the CUPI concurrency limiter for the current cluster
+	"""
+	global ucxn_session
+	global cupi_limiter
+	import requests
+	from urllib3 import disable_warnings
+	from urllib3.exceptions import InsecureRequestWarning
+	disable_warnings(InsecureRequestWarning)
+	ucxn_session = requests.Session()
+	ucxn_session.auth = cfg["creds"]
+	ucxn_session.headers.update(headers)
+	ucxn_session.verify = False
+	ucxn_adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(cfg["pin_workers"] + cfg["page_workers"], 10)) # one pooled connection per worker
+	ucxn_session.mount("https://", ucxn_adapter)
+	ucxn_session.mount("http://", ucxn_adapter)
+	cupi_limiter = AdaptiveLimiter(cfg["pin_workers"] + cfg["page_workers"]) # both pools run at once in streaming mode
+
+def init_cluster_process(log_queue):
 	"""
-	Sends user an expiration email if:
+	ProcessPoolExecutor initializer, keeps the queue the cluster process sends its log records to
+
+	Args:
+		log_queue (multiprocessing.Queue): read by a QueueListener in the parent, see get_clusters()
+	"""
+	global cluster_log_queue
+	cluster_log_queue = log_queue
+
+def fetch_cluster(cluster, parent_cfg, parent_state):
+	"""
+	Runs steps 1-3 for a single cluster, inside its own cluster process
+
+	- Points cfg at the cluster, with its own session, auth rules and PIN cache file
+	- Log lines are tagged with the cluster name, errors are logged and returned instead of exiting
+	- User and error emails are left to the parent process
+
+	Args:
+		cluster (dict): cluster from cfg["clusters"]
+		parent_cfg (dict): validated config of the parent process
+		parent_state (tuple): (today, time_start, full_refresh, reminders_only, resume, reminders_sent) of the parent process
+
+	Returns:
+		result (dict): name, status (OK or ERROR), mailboxes, stats and the metrics state
+	"""
+	global cfg, logger, metrics, rmode, show_progress, today, time_start, full_refresh, reminders_only, checkpoint
+	global total_mailboxes, mailboxes_with_exp_days, mailboxes_without_exp_days, total_expired_pins, total_24hr_pin_changes, total_mailbox_errors
+	global pin_cache_rows, authrules, mailboxes, reminders_sent
+	cfg = parent_cfg
+	today, time_start, full_refresh, reminders_only, resume, reminders_sent = parent_state
+	rmode         = "noemail" # cluster errors are reported in the admin email by the parent
+	show_progress = False
+	total_mailboxes = mailboxes_with_exp_days = mailboxes_without_exp_days = total_expired_pins = total_24hr_pin_changes = total_mailbox_errors = 0
+	pin_cache_rows  = {}
+	metrics         = Metrics()
+	mailboxes       = []
+
+	def tag_cluster(record):
+		record.cluster = cluster["name"]
+		record.msg     = f"[{cluster['name']}] {record.getMessage()}"
+		record.args    = None
+		return True
+
+	# log records go back to the parent listener, which writes them to the same log file and console
+	logger = logging.getLogger('global-log')
+	for handler in list(logger.handlers): logger.removeHandler(handler) # a forked process inherits the parent queue handler
+	handler = LogQueueHandler(cluster_log_queue, pickled=True)
+	handler.addFilter(tag_cluster)
+	logger.addHandler(handler)
+	logger.setLevel(logging.INFO if cfg["debug_lvl"] == "0" else logging.DEBUG)
+
+	cfg["ucxn_server"] = cluster["server"]
+	cfg["base_url"]    = cluster["base_url"]
+	cfg["creds"]       = cluster["creds"]
+	cfg["ldap_lookup"] = cluster["ldap_lookup"]
+	cfg["user_query"]  = cluster["user_query"]
+	cfg["cache_file_fqdn"] = cluster_file(cluster["name"], "pin_cache", ".db")
+	init_ucxn_session()
+	checkpoint = Checkpoint(cluster_file(cluster["name"], "checkpoint", ".ndjson"), resume) # removed by the parent once the whole run finishes
+
+	status = "OK"
+	try:
+		logger.info(f"Getting auth rules, mailboxes and PIN data from {cluster['server']}")
+		authrules = get_auth_rules()
+		mailboxes = get_mailboxes()
+		get_pin_data()
+		for m in mailboxes: m.cluster = cluster["name"]
+		logger.info(f"Finished, {len(mailboxes)} mailboxes")
+	except SystemExit: # the error was logged where it happened
+		status = "ERROR"
+	except Exception as e:
+		logger.error(f"Error: {e} on line {sys.exc_info()[2].tb_lineno}")
+		status = "ERROR"
+	checkpoint.close(finished=False)
+
+	return {
+		"name"     : cluster["name"],
+		"status"   : status,
+		"mailboxes": mailboxes if status == "OK" else [],
+		"stats"    : {
+			"total_mailboxes"           : int(total_mailboxes),
+			"mailboxes_with_exp_days"   : mailboxes_with_exp_days,
+			"mailboxes_without_exp_days": mailboxes_without_exp_days,
+			"total_expired_pins"        : total_expired_pins,
+			"total_24hr_pin_changes"    : total_24hr_pin_changes,
+			"total_mailbox_errors"      : total_mailbox_errors
+		},
+		"metrics"  : metrics.state()
+	}
+
+def get_clusters(resume=False):
+	"""
+	Runs steps 1-3 for every cluster in parallel, one process per cluster, see fetch_cluster()
+
+	- Mailboxes are merged in config order, so the report is grouped by cluster
+	- Stats and metrics are summed, per cluster stats are kept in cluster_stats for the admin email
+
+	If every cluster fails, sends the admin error email and exits.
+
+	Args:
+		resume (bool): each cluster resumes from its own checkpoint
+
+	Returns:
+		mailboxes (list[MailboxRecord])
+	"""
+	global total_mailboxes, mailboxes_with_exp_days, mailboxes_without_exp_days, total_expired_pins, total_24hr_pin_changes, total_mailbox_errors
+	import multiprocessing
+	from concurrent.futures import ProcessPoolExecutor
+	mailboxes = []
+	cluster_logs = multiprocessing.Queue()
+	cluster_log_listener = logging.handlers.QueueListener(cluster_logs, log_file_handler, log_console_handler, respect_handler_level=True)
+	cluster_log_listener.start()
+	with ProcessPoolExecutor(max_workers=len(cfg["clusters"]), initializer=init_cluster_process, initargs=(cluster_logs,)) as executor:
+		parent_state = (today, time_start, full_refresh, reminders_only, resume, reminders_sent)
+		futures = [executor.submit(fetch_cluster, c, cfg, parent_state) for c in cfg["clusters"]]
+		for c, future in zip(cfg["clusters"], futures):
+			try:
+				result = future.result()
+			except Exception as e: # the cluster process itself failed
+				logger.error(f"Error: {c['name']}: {e}")
+				result = {"name": c["name"], "status": "ERROR", "mailboxes": [], "stats": {}, "metrics": ({}, {})}
+			mailboxes.extend(result["mailboxes"])
+			metrics.merge(result["metrics"])
+			stats = result["stats"]
+			total_mailboxes            = int(total_mailboxes) + stats.get("total_mailboxes", 0)
+			mailboxes_with_exp_days    += stats.get("mailboxes_with_exp_days", 0)
+			mailboxes_without_exp_days += stats.get("mailboxes_without_exp_days", 0)
+			total_expired_pins         += stats.get("total_expired_pins", 0)
+			total_24hr_pin_changes     += stats.get("total_24hr_pin_changes", 0)
+			total_mailbox_errors       += stats.get("total_mailbox_errors", 0)
+			cluster_stats.append({"name": result["name"], "server": c["server"], "status": result["status"], **stats})
+			logger.info(f"Cluster {result['name']}: {result['status']}, {stats.get('total_mailboxes', 0)} mailboxes")
+	cluster_log_listener.stop()
+
+	if all(c["status"] == "ERROR" for c in cluster_stats):
+		logger.error("Error: every cluster failed")
+		send_admin_email_error()
+		sys.exit(1)
+	return mailboxes
+
+class SMTPPool:
+	"""
+	Pool of long lived SMTP connections shared by all of the email functions
+
+	- Connections are opened on first use and reused for every message after that
+	- A connection is reopened once it has sent max_messages, or if the server disconnected it
+	- Thread safe, a caller waits until one of the connections is free
+
+	Args:
+		server (str): SMTP server ip/fqdn, optionally with :port
+		size (int): number of connections
+		max_messages (int): messages sent on a connection before it is reopened
+	"""
+	def __init__(self, server, size=1, max_messages=100):
+		self.server       = server
+		self.max_messages = max_messages
+		self.slots        = queue.Queue()
+		for _ in range(size): self.slots.put({"smtp": None, "sent": 0})
+
+	def _connect(self, slot):
+		self._disconnect(slot)
+		import smtplib
+		logger.debug("Opening SMTP connection to %s", self.server)
+		slot["smtp"] = smtplib.SMTP(self.server)
+		slot["sent"] = 0
+
+	def _disconnect(self, slot):
+		if slot["smtp"] is None: return
+		try:
+			slot["smtp"].quit()
+		except Exception:
+			slot["smtp"].close()
+		slot["smtp"] = None
+
+	def sendmail(self, sender, receivers, msg):
+		"""
+		Sends a message on the next free connection
+
+		Reconnects and retries once if the server closed the connection while it was idle. A connection error drops the
+		connection, it is reopened on next use. An error for this message only, like a refused recipient, keeps the
+		connection, smtplib has already reset it for the next message.
+
+		Args:
+			sender (str): from address
+			receivers (str|list): to address(es)
+			msg (str): message.as_string()
+		"""
+		import smtplib
+		slot = self.slots.get()
+		time_start = time.perf_counter()
+		try:
+			if slot["smtp"] is None or slot["sent"] >= self.max_messages: self._connect(slot)
+			try:
+				slot["smtp"].sendmail(sender, receivers, msg)
+			except smtplib.SMTPServerDisconnected:
+				logger.debug("SMTP connection was closed by the server, reconnecting")
+				metrics.count("smtp_reconnects")
+				self._connect(slot)
+				slot["smtp"].sendmail(sender, receivers, msg)
+			slot["sent"] += 1
+			metrics.observe("smtp_send", time.perf_counter() - time_start, "", len(msg))
+		except smtplib.SMTPServerDisconnected:
+			self._disconnect(slot)
+			metrics.count("smtp_errors")
+			raise
+		except smtplib.SMTPException: # SMTPRecipientsRefused, SMTPSenderRefused, SMTPDataError...
+			metrics.count("smtp_errors")
+			raise
+		except OSError: # ConnectionError, socket.timeout, the connection state is unknown, reopen it on next use
+			self._disconnect(slot)
+			metrics.count("smtp_errors")
+			raise
+		finally:
+			self.slots.put(slot)
+
+	def close(self):
+		"""
+		Quits every open connection
+		"""
+		slots = []
+		while not self.slots.empty(): slots.append(self.slots.get())
+		for slot in slots:
+			self._disconnect(slot)
+			self.slots.put(slot)
+
+def load_email_assets():
+	"""
+	Loads the email templates and user reminder attachment once at startup
+
+	- Reads the admin and user reminder txt/html templates
+	- Checks the templates only use known placeholders, so a bad template fails now instead of on every email
+	- Reads and base64 encodes the user reminder attachment into a MIME part that every reminder reuses
+
+	Returns:
+		assets (dict): templates as str and the attachment as a MIMEBase, or None if no attachment is configured
+	"""
+	try:
+		assets = {}
+		for k, file_fqdn in (
+			("user_txt",  cfg["user_reminder_email_file_fqdn_txt"]),
+			("user_html", cfg["user_reminder_email_file_fqdn_html"]),
+			("admin_txt",  cfg["admin_report_email_file_fqdn_txt"]),
+			("admin_html", cfg["admin_report_email_file_fqdn_html"])
+		):
+			with open(file_fqdn, "r") as f:
+				assets[k] = f.read()
+		assets["user_txt"].format(ext="", days="")
+		assets["user_html"].format(ext="", days="")
+
+		assets["user_attachment"] = None
+		if not cfg["user_reminder_attachment_file_name"] == "none":
+			from email import encoders
+			from email.mime.base import MIMEBase
+			# Open file in binary mode
+			with open(cfg['user_reminder_attachment_file_fqdn'], "rb") as attachment:
+				part_att = MIMEBase("application", "octet-stream") # Add file as application/octet-stream
+				part_att.set_payload(attachment.read())            # Email client can usually download this automatically as attachment
+
+			# Encode file in ASCII characters to send by email    
+			encoders.encode_base64(part_att)
+
+			# Add header as key/value pair to attachment part
+			part_att.add_header(
+				"Content-Disposition",
+				f"attachment; filename= {cfg['user_reminder_attachment_file_name']}",
+			)
+			assets["user_attachment"] = part_att
+		return assets
+	except KeyError as e:
+		logger.error(f"Error in user reminder email template: unknown placeholder {e}, only {{ext}} and {{days}} are supported")
+		sys.exit(1)
+	except Exception as e:
+		logger.error(f"Error loading email assets: {e} on line {sys.exc_info()[2].tb_lineno}")
+		sys.exit(1)
+
+def build_user_email(m):
+	"""
+	Builds the reminder email for a single mailbox from the preloaded email assets
+
+	Args:
+		m (MailboxRecord): mailbox
+
+	Returns:
+		message (MIMEMultipart)
+	"""
+	if m.days_until_expired > 1:
+		days_str = f"{m.days_until_expired} days"
+	elif m.days_until_expired == 0:
+		days_str = "today"
+	else:
+		days_str = f"{m.days_until_expired} day"
+
+	from email.mime.multipart import MIMEMultipart
+	from email.mime.text import MIMEText
+	message            = MIMEMultipart("alternative")
+	message["Subject"] = f"{m.extension} - Voicemail PIN About to Expire - {m.expiration_date}"
+	message["From"]    = cfg['from_address']
+	message["To"]      = m.email_address
+
+	text = email_assets["user_txt"].format(ext=m.extension,days=days_str)
+	html = email_assets["user_html"].format(ext=m.extension,days=days_str)
+
+	message.attach(MIMEText(text, "plain")) # Add HTML/plain-text parts to MIMEMultipart message
+	message.attach(MIMEText(html, "html"))  # The email client will try to render the last part first
+	if email_assets["user_attachment"] is not None: message.attach(email_assets["user_attachment"]) # Attachment File, shared by every message
+	return message
+
+class RateLimiter:
+	"""
+	Token bucket that paces callers to a maximum rate
+
+	Thread safe, acquire() blocks until a token is available.
+
+	Args:
+		rate (float): tokens per second, 0 disables the limit
+	"""
+	def __init__(self, rate):
+		self.rate     = rate
+		self.capacity = max(1.0, rate) # allows up to one second of burst
+		self.tokens   = self.capacity
+		self.updated  = time.monotonic()
+		self.lock     = threading.Lock()
+
+	def acquire(self):
+		if self.rate <= 0: return
+		while True:
+			with self.lock:
+				now          = time.monotonic()
+				self.tokens  = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+				self.updated = now
+				if self.tokens >= 1:
+					self.tokens -= 1
+					return
+				wait = (1 - self.tokens) / self.rate
+			time.sleep(wait)
+
+class ReminderDispatcher:
+	"""
+	Sends user reminder emails from a pool of SMTP worker threads
+
+	- submit() builds the message on the calling thread (the producer) and queues it
+	- The workers send through smtp_pool, paced by a messages per second token bucket
+	- Outcomes come back through a results queue and are applied by collect() on the calling thread,
+	  so the mailbox dicts and the email counters are only ever updated from one thread
+
+	Args:
+		workers (int): number of SMTP worker threads
+		rate (float): max messages per second across all workers, 0 is unlimited
+	"""
+	def __init__(self, workers, rate):
+		self.work_q  = queue.Queue(maxsize=workers*4) # bounds how far the producer can get ahead
+		self.results = queue.Queue()
+		self.limiter = RateLimiter(rate)
+		self.pending = 0
+		self.threads = [threading.Thread(target=self._worker, daemon=True) for _ in range(workers)]
+		for t in self.threads: t.start()
+
+	def _worker(self):
+		while True:
+			item = self.work_q.get()
+			if item is None: return
+			m, msg = item
+			self.limiter.acquire()
+			try:
+				smtp_pool.sendmail(cfg['from_address'], m.email_address, msg)
+				logger.debug("Successfully sent email to=%s", m.email_address)
+				self.results.put((m, True))
+			except Exception as e:
+				logger.error(f"Error: User email was not sent to {m.email_address}: {e}")
+				self.results.put((m, False))
+
+	def submit(self, m):
+		"""
+		Builds and queues the reminder email for a mailbox, blocks while the queue is full
+
+		Args:
+			m (MailboxRecord): mailbox
+		"""
+		logger.debug("Setting up email for Alias=%s", m.alias)
+		message = build_user_email(m)
+		self.pending += 1
+		self.work_q.put((m, message.as_string()))
+
+	def collect(self, block=False):
+		"""
+		Applies finished send outcomes to the mailboxes and the email counters
+
+		Args:
+			block (bool): wait for every submitted email, otherwise only apply the ones already finished
+
+		Yields:
+			m (MailboxRecord): mailbox whose email finished
+		"""
+		global total_user_emails_sent
+		global total_user_email_failures
+		while self.pending:
+			try:
+				m, sent = self.results.get(block=block)
+			except queue.Empty:
+				return
+			self.pending -= 1
+			if sent:
+				m.expiration_email_sent = True
+				reminders_sent[m.object_id] = today.date()
+				checkpoint.sent_to(m.object_id)
+				sent_log.add(m.object_id)
+				total_user_emails_sent += 1
+			else:
+				total_user_email_failures += 1
+			yield m
+
+	def close(self):
+		"""
+		Waits for the queued emails to finish, applies their outcomes and stops the workers
+
+		Yields:
+			m (MailboxRecord): mailbox whose email finished
+		"""
+		for _ in self.threads: self.work_q.put(None)
+		yield from self.collect(block=True)
+		for t in self.threads: t.join()
+
+def reminder_due(m):
+	"""
+	Checks if a mailbox should be sent a reminder email today:
 
 	- PIN Never Expires == false
 	- Mailbox has an email address configured
 	- Auth Rule expiration days isn't 0
 	- If Days Until Expired matches one of the configured email intervals
+	- Mailbox was not already sent one today, by this or an earlier run, see SentLog
 
-	If successful, returns updated mailboxes (list[dict]). Otherwise raise an exception.
+	Args:
+		m (MailboxRecord): mailbox
 
 	Returns:
-		mailboxes (dict)
+		bool
 	"""
-	for m in tqdm(mailboxes):
-		try:
-			if m["Auth Rule"] == "ERROR": continue # skips errored mailbox
-			if m["PIN Doesnt Expire"] == "false" and m["Email Address"] != "" and m["Expiration Days"] != "0":
-				if any(str(m["Days Until Expired"]) in s for s in cfg['email_intervals']):
-					logger.debug(f"Setting up email for Alias={m['Alias']}")
-
-					if m["Days Until Expired"] > 1:
-						days_str = f"{m['Days Until Expired']} days"
-					elif m["Days Until Expired"] == 0:
-						days_str = "today"
-					else:
-						days_str = f"{m['Days Until Expired']} day"
-
-					sender    = cfg['from_address']
-					receivers = m["Email Address"]
-
-					message            = MIMEMultipart("alternative")
-					message["Subject"] = f"{m['Extension']} - Voicemail PIN About to Expire - {m['Expiration Date']}"
-					message["From"]    = sender
-					message["To"]      = receivers
-
-					text = open(cfg["user_reminder_email_file_fqdn_txt"], "r")
-					text = text.read()
-					text = text.format(ext=m['Extension'],days=days_str)
-					html = open(cfg["user_reminder_email_file_fqdn_html"], "r")
-					html = html.read()
-					html = html.format(ext=m['Extension'],days=days_str)
-
-					attachment_filename = cfg['user_reminder_attachment_file_name']  # In same directory as script
-
-					# Open file in binary mode
-					if not cfg["user_reminder_attachment_file_name"] == "none":
-						with open(cfg['user_reminder_attachment_file_fqdn'], "rb") as attachment:
-							part_att = MIMEBase("application", "octet-stream") # Add file as application/octet-stream
-							part_att.set_payload(attachment.read())            # Email client can usually download this automatically as attachment
-
-						# Encode file in ASCII characters to send by email    
-						encoders.encode_base64(part_att)
-
-						# Add header as key/value pair to attachment part
-						part_att.add_header(
-							"Content-Disposition",
-							f"attachment; filename= {attachment_filename}",
-						)
-
-					message.attach(MIMEText(text, "plain")) # Add HTML/plain-text parts to MIMEMultipart message
-					message.attach(MIMEText(html, "html"))  # The email client will try to render the last part first
-					if not cfg["user_reminder_attachment_file_name"] == "none": message.attach(part_att) # Attachment File
-
-					smtpObj = smtplib.SMTP(cfg['smtp_server'])
-					smtpObj.sendmail(sender, receivers, message.as_string())
-					m["Expiration Email Sent"] = "true"
-					logger.debug(f"Successfully sent email to={receivers}")
-					global total_user_emails_sent
-					total_user_emails_sent += 1
-		except Exception as e:
-			logger.error(f"Error: User email was not sent: {e} on line {sys.exc_info()[2].tb_lineno}")
+	if m.auth_rule == "ERROR": return False # skips errored mailbox
+	if reminders_sent.get(m.object_id) == today.date(): return False # already sent by an earlier run or daemon job today
+	return not m.pin_doesnt_expire and m.email_address != "" and m.expiration_days != 0 and m.days_until_expired in cfg['email_intervals']
+
+def send_user_email():
+	"""
+	Sends the user expiration emails through a ReminderDispatcher
+
+	- Mailboxes are checked with reminder_due()
+	- Messages are built here and sent by send_workers SMTP threads, paced to max_messages_per_second
+	- Records the send throughput for the admin email
+
+	If successful, returns updated mailboxes (list[MailboxRecord]). Otherwise raise an exception.
+
+	Returns:
+		mailboxes (list[MailboxRecord])
+	"""
+	global email_throughput
+	due = [m for m in mailboxes if reminder_due(m)]
+	time_send_start = time.monotonic()
+	dispatcher = ReminderDispatcher(cfg['smtp_workers'], cfg['smtp_rate'])
+	with progress_bar(total=len(due)) as progress:
+		for m in due:
+			try:
+				dispatcher.submit(m)
+			except Exception as e:
+				logger.error(f"Error: User email was not sent: {e} on line {sys.exc_info()[2].tb_lineno}")
+				global total_user_email_failures
+				total_user_email_failures += 1
+				progress.update(1)
+			for _ in dispatcher.collect(): progress.update(1)
+		for _ in dispatcher.close(): progress.update(1)
+	time_send = time.monotonic() - time_send_start
+	email_throughput = total_user_emails_sent / time_send if time_send > 0 else 0
+	logger.debug("User emails sent = %s, failed = %s, %.1f emails/sec", total_user_emails_sent, total_user_email_failures, email_throughput)
 
 	return mailboxes
 
+def cluster_summary_rows():
+	"""
+	Returns:
+		rows (list[list]): header row then one row per cluster, empty with a single cluster
+	"""
+	if len(cfg["clusters"]) == 1: return []
+	emails_sent = collections.Counter(m.cluster for m in mailboxes if m.expiration_email_sent)
+	rows = [["Cluster", "Status", "Mailboxes", "Expired PINs", "Changed 24hrs", "Errors", "Emails Sent"]]
+	for c in cluster_stats:
+		rows.append([c["name"], c["status"], c.get("total_mailboxes", 0), c.get("total_expired_pins", 0), c.get("total_24hr_pin_changes", 0), c.get("total_mailbox_errors", 0), emails_sent[c["name"]]])
+	return rows
+
+def cluster_summary_text():
+	rows = cluster_summary_rows()
+	if not rows: return ""
+	width = max(len(str(r[0])) for r in rows) + 2
+	lines = [f"{r[0]:<{width}}" + "".join(f"{str(v):>14}" for v in r[1:]) for r in rows]
+	return "Clusters\n" + "\n".join(lines) + "\n\n"
+
+def cluster_summary_html():
+	rows = cluster_summary_rows()
+	if not rows: return ""
+	html = "<tr>" + "".join(f"<th>{v}</th>" for v in rows[0]) + "</tr>"
+	for r in rows[1:]: html += "<tr>" + "".join(f"<td>{v}</td>" for v in r) + "</tr>"
+	return f"Clusters<br>\n\t\t\t<table>{html}</table>\n\t\t\t<br>\n\n\t\t\t"
+
+ATTACHMENT_CHUNK         = 1048576
+PRECOMPRESSED_EXTENSIONS = (".xlsx", ".parquet") # already zip/zstd compressed, attached as is
+LOG_ERROR_RE             = re.compile(rb' - (ERROR|CRITICAL) - |"level": "(ERROR|CRITICAL)"')
+LOG_RECORD_RE            = re.compile(rb'\d{4}-\d\d-\d\d |\{"time"') # start of a log record, other lines continue the record above
+
+def compress_attachment(src, filename, compression, limit=None):
+	"""
+	Streams a file into a gzip or zip archive in a temporary file, a chunk at a time
+
+	Args:
+		src (file): binary file object read from its current position
+		filename (str): name of the file inside the archive
+		compression (str): gzip, zip or none
+		limit (int): stop once the archive is over this many bytes, None for no limit
+
+	Returns:
+		(archive, attachment_filename) (tuple): archive is an open temporary file, archive.tell() is its size,
+		None if the archive went over limit
+	"""
+	import gzip
+	import zipfile
+	import tempfile
+	archive = tempfile.TemporaryFile()
+	def copy(dst):
+		while True:
+			chunk = src.read(ATTACHMENT_CHUNK)
+			if not chunk: return True
+			dst.write(chunk)
+			if limit is not None and archive.tell() > limit: return False
+	if compression == "gzip":
+		with gzip.GzipFile(filename=filename, mode="wb", fileobj=archive, compresslevel=6) as gz: complete = copy(gz) # 9 is several times slower for little gain
+		filename += ".gz"
+	elif compression == "zip":
+		with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+			with zf.open(filename, "w", force_zip64=True) as member: complete = copy(member)
+		filename = os.path.splitext(filename)[0] + ".zip"
+	else:
+		complete = copy(archive)
+	if not complete or (limit is not None and archive.tell() > limit):
+		archive.close()
+		return None, filename
+	return archive, filename
+
+def mime_attachment(archive, filename):
+	"""
+	Base64 encodes an archive from compress_attachment() into an attachment part. Closes the archive.
+	The encoded copy is held in memory, as is the message from as_string() when it is sent,
+	both are bounded by admin_attachment_max_mb
+
+	Returns:
+		part (MIMEBase)
+	"""
+	import base64
+	from email.mime.base import MIMEBase
+	archive.seek(0)
+	payload = base64.encodebytes(archive.read()).decode("ascii")
+	archive.close()
+	subtype = {".gz": "gzip", ".zip": "zip"}.get(os.path.splitext(filename)[1], "octet-stream")
+	part = MIMEBase("application", subtype)
+	part.set_payload(payload)
+	part["Content-Transfer-Encoding"] = "base64"
+	part.add_header("Content-Disposition", "attachment", filename=filename)
+	return part
+
+def report_attachments(hostname):
+	"""
+	Picks which report files are attached to the admin email
+
+	Reports are compressed per attachment_compression, except xlsx and parquet which already are,
+	then attached in report_format order while their total stays under admin_attachment_max_mb,
+	the rest are left in the reports folder and only listed in the email.
+
+	Args:
+		hostname (str): machine the reports are saved on
+
+	Returns:
+		reports (list[tuple]): (report filename, size in bytes, "attached" or where the file is saved)
+		parts (list[MIMEBase]): attachments
+	"""
+	budget  = cfg["admin_attachment_max_mb"] * 1048576
+	reports = []
+	parts   = []
+	saved   = f"saved on {hostname} in {os.path.abspath(cfg['reports_folder_name'])}"
+	for f in report_files:
+		file_fqdn   = os.path.join(cfg["reports_folder_name"], f)
+		size        = os.path.getsize(file_fqdn)
+		compression = "none" if f.endswith(PRECOMPRESSED_EXTENSIONS) else cfg["attachment_compression"]
+		if compression == "none" and size > budget:
+			reports.append((f, size, saved))
+			continue
+		with open(file_fqdn, "rb") as src:
+			archive, attachment_filename = compress_attachment(src, f, compression, int(budget))
+		if archive is None:
+			reports.append((f, size, saved))
+			continue
+		attached_size = archive.tell()
+		budget -= attached_size
+		parts.append(mime_attachment(archive, attachment_filename))
+		reports.append((f, size, "attached" if attachment_filename == f else f"attached as {attachment_filename} ({attached_size/1048576:.1f} MB)"))
+	return reports, parts
+
+def report_summary_text(reports):
+	lines = [f"{f}  {size/1048576:.1f} MB  {where}" for f, size, where in reports]
+	return "Reports\n" + "\n".join(lines) + "\n\n"
+
+def report_summary_html(reports):
+	html = "<tr><th>Report</th><th>MB</th><th></th></tr>"
+	for f, size, where in reports: html += f"<tr><td>{f}</td><td>{size/1048576:.1f}</td><td>{where}</td></tr>"
+	return f"Reports<br>\n\t\t\t<table>{html}</table>\n\t\t\t<br>\n\n\t\t\t"
+
 def send_admin_email():
 	"""
 	Sends admin email
 
-	Attaches generated report
+	Attaches the generated reports, compressed, up to admin_attachment_max_mb, see report_attachments()
 
 	"""
 	try:
 		hostname   = socket.gethostname()
 		ip_address = socket.gethostbyname(hostname)
 
+		from email.mime.multipart import MIMEMultipart
+		from email.mime.text import MIMEText
 		sender    = cfg['from_address']
 		receivers = cfg['admin_email']
 
@@ -471,69 +1968,114 @@ def send_admin_email():
 		message["From"]    = sender
 		message["To"]      = ", ".join(receivers)
 
-		text = open(cfg["admin_report_email_file_fqdn_txt"], "r")
-		text = text.read()
-		text = text.format(
-			total_mailboxes            = total_mailboxes,
-			mailboxes_with_exp_days    = mailboxes_with_exp_days,
-			mailboxes_without_exp_days = mailboxes_without_exp_days,
-			total_expired_pins         = total_expired_pins,
-			total_24hr_pin_changes     = total_24hr_pin_changes,
-			total_mailbox_errors       = total_mailbox_errors,
-			total_emails_sent          = total_user_emails_sent,
-			time_total                 = f"{time_total[0]} minutes {time_total[1]} seconds",
-			client_info                = f"{hostname} / {ip_address}"
-		)
-		html = open(cfg["admin_report_email_file_fqdn_html"], "r")
-		html = html.read()
-		html = html.format(
-			total_mailboxes            = total_mailboxes,
-			mailboxes_with_exp_days    = mailboxes_with_exp_days,
-			mailboxes_without_exp_days = mailboxes_without_exp_days,
-			total_expired_pins         = total_expired_pins,
-			total_24hr_pin_changes     = total_24hr_pin_changes,
-			total_mailbox_errors       = total_mailbox_errors,
-			total_emails_sent          = total_user_emails_sent,
-			time_total                 = f"{time_total[0]} minutes {time_total[1]} seconds",
-			client_info                = f"{hostname} / {ip_address}"
-		)
-
-		attachment_filename = report_filename  # In same directory as script
-
-		# Open file in binary mode
-		with open(os.path.join(cfg["reports_folder_name"], attachment_filename), "rb") as attachment:
-			part_att = MIMEBase("application", "octet-stream") # Add file as application/octet-stream
-			part_att.set_payload(attachment.read())            # Email client can usually download this automatically as attachment
-
-		# Encode file in ASCII characters to send by email    
-		encoders.encode_base64(part_att)
-
-		# Add header as key/value pair to attachment part
-		part_att.add_header(
-			"Content-Disposition",
-			f"attachment; filename= {attachment_filename}",
-		)
+		stats = {
+			"total_mailboxes"           : total_mailboxes,
+			"mailboxes_with_exp_days"   : mailboxes_with_exp_days,
+			"mailboxes_without_exp_days": mailboxes_without_exp_days,
+			"total_expired_pins"        : total_expired_pins,
+			"total_24hr_pin_changes"    : total_24hr_pin_changes,
+			"total_mailbox_errors"      : total_mailbox_errors,
+			"total_emails_sent"         : total_user_emails_sent,
+			"total_email_failures"      : total_user_email_failures,
+			"email_throughput"          : f"{email_throughput:.1f} emails/sec",
+			"time_total"                : f"{time_total[0]} minutes {time_total[1]} seconds",
+			"client_info"               : f"{hostname} / {ip_address}"
+		}
+		reports, parts = report_attachments(hostname)
+		text = email_assets["admin_txt"].format(**stats, cluster_summary=cluster_summary_text(), report_summary=report_summary_text(reports), metrics_summary=metrics.summary_text())
+		html = email_assets["admin_html"].format(**stats, cluster_summary=cluster_summary_html(), report_summary=report_summary_html(reports), metrics_summary=metrics.summary_html())
 
 		message.attach(MIMEText(text, "plain")) # Add HTML/plain-text parts to MIMEMultipart message
 		message.attach(MIMEText(html, "html"))  # The email client will try to render the last part first
-		message.attach(part_att)                # Attachment File
 
-		smtpObj = smtplib.SMTP(cfg['smtp_server'])
-		smtpObj.sendmail(sender, receivers, message.as_string())
+		for part in parts: message.attach(part) # Attachment Files
+
+		smtp_pool.sendmail(sender, receivers, message.as_string())
 		logger.info(f"Admin email successfully sent to: {receivers}")
 	except Exception as e:
 		logger.error(f"Error: Admin email was not sent: {e} on line {sys.exc_info()[2].tb_lineno}")
 
+def log_error_digest(limit):
+	"""
+	The ERROR and CRITICAL records of the log file, with the lines that continue them such as tracebacks
+
+	Args:
+		limit (int): keep the last records up to this many bytes
+
+	Returns:
+		digest (bytes)
+	"""
+	records  = collections.deque()
+	total    = 0
+	size     = 0
+	in_error = False
+	def add(line):
+		nonlocal total, size, in_error
+		if LOG_RECORD_RE.match(line):
+			in_error = LOG_ERROR_RE.search(line) is not None
+			if in_error: total += 1
+		if not in_error: return
+		records.append(line)
+		size += len(line)
+		while size > limit and len(records) > 1: size -= len(records.popleft()) # keeps at least the last error
+	with open(log_file_actual, "rb") as f:
+		carry = b""
+		for chunk in iter(lambda: f.read(ATTACHMENT_CHUNK), b""):
+			chunk = carry + chunk
+			cut   = chunk.rfind(b"\n") + 1
+			chunk, carry = chunk[:cut], chunk[cut:]
+			# most of a debug log has no errors, whole chunks are skipped without splitting them into lines
+			if not in_error and b"ERROR" not in chunk and b"CRITICAL" not in chunk: continue
+			for line in chunk.splitlines(keepends=True): add(line)
+		if carry: add(carry)
+	header = f"{total} error records in {log_file_fullname}, the last {limit/1048576:.1f} MB of them follow\n\n".encode()
+	return header + b"".join(records)
+
+def log_attachments():
+	"""
+	Picks what of the log file is attached to the error email, within admin_attachment_max_mb
+
+	- The whole log, compressed per attachment_compression, if it fits
+	- Otherwise an error digest, see log_error_digest(), and the tail of the log, in the space the digest leaves
+
+	Returns:
+		parts (list[MIMEBase]): attachments
+		note (str): what was attached, for the email body
+	"""
+	import io
+	budget      = int(cfg["admin_attachment_max_mb"] * 1048576)
+	compression = cfg["attachment_compression"]
+	log_size    = os.path.getsize(log_file_actual)
+	saved       = f"the log is saved on {socket.gethostname()} in {os.path.abspath(os.path.dirname(log_file_actual))}"
+	if budget <= 0: return [], saved
+	with open(log_file_actual, "rb") as f:
+		archive, attachment_filename = compress_attachment(f, log_file_fullname, compression, budget)
+	if archive is not None: return [mime_attachment(archive, attachment_filename)], "see attached log for more details"
+
+	base, ext = os.path.splitext(log_file_fullname)
+	digest, digest_filename = compress_attachment(io.BytesIO(log_error_digest(budget // 2)), f"{base}-errors{ext}", compression)
+	tail_limit = max(0, budget - digest.tell()) # the tail compresses to less than its raw size, so the two fit in the budget
+	with open(log_file_actual, "rb") as f:
+		f.seek(max(0, log_size - tail_limit))
+		if f.tell() > 0: f.readline() # start on a whole line
+		tail_size = log_size - f.tell()
+		tail, tail_filename = compress_attachment(f, f"{base}-tail{ext}", compression)
+	note = (f"the log is {log_size/1048576:.1f} MB, over the {cfg['admin_attachment_max_mb']:g} MB attachment limit, "
+		f"attached are its error records and its last {tail_size/1048576:.1f} MB, {saved}")
+	return [mime_attachment(digest, digest_filename), mime_attachment(tail, tail_filename)], note
+
 def send_admin_email_error():
 	"""
 	Sends admin email if a crash error occurs
 
-	Attaches log file
+	Attaches the log file compressed, or its error records and tail if it is over admin_attachment_max_mb, see log_attachments()
 
 	"""
 	try:
 		if rmode == "noemail": return
 		
+		from email.mime.multipart import MIMEMultipart
+		from email.mime.text import MIMEText
 		sender    = cfg['from_address']
 		receivers = cfg['admin_email']
 
@@ -542,69 +2084,146 @@ def send_admin_email_error():
 		message["From"]    = sender
 		message["To"]      = ", ".join(receivers)
 
-		text = "An error has occurred, see attached log for more details..."
-		html = "An error has occurred, see attached log for more details..."
-
-		attachment_filename = log_file_fullname  # In same directory as script
-
-		# Open file in binary mode
-		with open(log_file_actual, "rb") as attachment:
-			part_att = MIMEBase("application", "octet-stream") # Add file as application/octet-stream
-			part_att.set_payload(attachment.read())            # Email client can usually download this automatically as attachment
+		flush_log()
+		parts, note = log_attachments()
 
-		# Encode file in ASCII characters to send by email    
-		encoders.encode_base64(part_att)
-
-		# Add header as key/value pair to attachment part
-		part_att.add_header(
-			"Content-Disposition",
-			f"attachment; filename= {attachment_filename}",
-		)
+		text = f"An error has occurred, {note}..."
+		html = f"An error has occurred, {note}..."
 
 		message.attach(MIMEText(text, "plain")) # Add HTML/plain-text parts to MIMEMultipart message
 		message.attach(MIMEText(html, "html"))  # The email client will try to render the last part first
-		message.attach(part_att)                # Attachment File
+		for part in parts: message.attach(part) # Attachment Files
 
-		smtpObj = smtplib.SMTP(cfg['smtp_server'])
-		smtpObj.sendmail(sender, receivers, message.as_string())
+		smtp_pool.sendmail(sender, receivers, message.as_string())
 		logger.info(f"Admin error email successfully sent to: {receivers}")
 	except Exception as e:
 		logger.error(f"Error: Admin error email was not sent: {e} on line {sys.exc_info()[2].tb_lineno}")
 
-def generate_report():
+def stream_mailboxes():
 	"""
-	Generates PIN report file
+	Streams mailboxes through steps 2 to 5 instead of finishing each step for every mailbox first
+
+	- Mailbox pages flow straight into the PIN fetch workers
+	- Mailboxes due a reminder go straight to the ReminderDispatcher, unless -noemail was used
+	- Finished rows go straight to the report writers in mailbox order, a row only waits on its own reminder email
+	- Only mailboxes still in flight are held here, there is no global mailboxes list
 
-	- Creates pandas dataframe from mailboxes (dict)
-	- Loads dataframe into ExcelWriter
-	- Dynamically adjust all the column lengths
-	- Saves as XSLX file
+	If successful, returns the report file names. Otherwise raise an exception.
 
 	Returns:
-		report_filename (str): filename used for admin email attachment
+		report_files (list[str]): file names used for the admin email
 	"""
+	global email_throughput
+	global total_user_email_failures
 	try:
-		# Create a Pandas Excel writer using XlsxWriter engine.
-		df = pandas.DataFrame(mailboxes)
-		del df["ObjectId"]
-		report_filename = 'ucxn_voicemail_pin_report_'+datetime.datetime.now().strftime("%Y-%m-%d-%I-%M-%S")+'.xlsx'
-		writer = pandas.ExcelWriter(os.path.join(cfg["reports_folder_name"], report_filename), engine='xlsxwriter')
-		# Convert the dataframe to an XlsxWriter Excel object.
-		df.to_excel(writer, sheet_name='Summary', index=False)
-		number_rows = (len(df.index) + 1)
-		workbook  = writer.book
-		worksheet = writer.sheets['Summary']
+		total_pages  = get_mailbox_total()
+		mailbox_iter = (m for page in iter_mailbox_pages(total_pages) for m in page)
+		report       = open_report()
+		dispatcher   = None
+		if not rmode == "noemail": dispatcher = ReminderDispatcher(cfg['smtp_workers'], cfg['smtp_rate'])
+		rows         = collections.deque() # mailboxes not yet in the report, in mailbox order
+		waiting      = set()               # id() of the mailboxes waiting on their reminder email
+		time_send_start = time.monotonic()
+
+		for m in progress_bar(iter_pin_data(mailbox_iter), total=int(total_mailboxes)):
+			rows.append(m)
+			if dispatcher is not None:
+				if reminder_due(m):
+					try:
+						dispatcher.submit(m)
+						waiting.add(id(m))
+					except Exception as e:
+						logger.error(f"Error: User email was not sent: {e} on line {sys.exc_info()[2].tb_lineno}")
+						total_user_email_failures += 1
+				for done in dispatcher.collect(): waiting.discard(id(done))
+			while rows and id(rows[0]) not in waiting: report.add(rows.popleft())
+
+		if dispatcher is not None:
+			for done in dispatcher.close(): waiting.discard(id(done))
+			time_send = time.monotonic() - time_send_start
+			email_throughput = total_user_emails_sent / time_send if time_send > 0 else 0
+		while rows: report.add(rows.popleft())
+		return report.close()
+	except Exception as e:
+		logger.error(f"Error: {e} on line {sys.exc_info()[2].tb_lineno}")
+		send_admin_email_error()
+		sys.exit(1)
+
+def report_columns():
+	"""
+	Returns:
+		columns (list): (report column, MailboxRecord attribute) tuples in report order
+	"""
+	columns = REPORT_COLUMNS
+	if not cfg["cache_enabled"]:  columns = [c for c in columns if c[0] != "From Cache"]
+	if len(cfg["clusters"]) == 1: columns = [c for c in columns if c[0] != "Cluster"]
+	return columns
+
+class ReportWriter:
+	"""
+	Writes the XLSX report one mailbox row at a time
+
+	- Uses xlsxwriter constant_memory mode, each row is flushed to disk once the next row starts
+	- Tracks the widest value of each column as rows arrive instead of rescanning the data at the end
+	- The header row is formatted as it is written, close() adds the autofilter, freeze panes, conditional formats
+	  and column widths, then saves the file
+
+	Args:
+		report_filename (str): file name in the reports folder
+	"""
+	def __init__(self, report_filename):
+		import xlsxwriter
+		self.report_filename = report_filename
+		self.columns     = report_columns()
+		self.workbook    = xlsxwriter.Workbook(os.path.join(cfg["reports_folder_name"], self.report_filename), {'constant_memory': True})
+		self.worksheet   = self.workbook.add_worksheet('Summary')
+		self.date_format = self.workbook.add_format({'num_format': 'yyyy-mm-dd'})
+		header_format    = self.workbook.add_format({'bold': True, 'bg_color': '#4472C4', 'font_color': '#FFFFFF'})
+		self.widths      = [len(column) for column, attr in self.columns]
+		self.row         = 0
+		for col, (column, attr) in enumerate(self.columns): self.worksheet.write_string(0, col, column, header_format)
+
+	def add(self, m):
+		"""
+		Args:
+			m (MailboxRecord): mailbox, None attributes are left blank
+		"""
+		self.row += 1
+		for col, (column, attr) in enumerate(self.columns):
+			value = getattr(m, attr)
+			if value is None: continue
+			if isinstance(value, bool):
+				value = "true" if value else "false" # the conditional formats match on the text
+				self.worksheet.write_string(self.row, col, value)
+			elif isinstance(value, datetime.date):
+				self.worksheet.write_datetime(self.row, col, value, self.date_format)
+			elif isinstance(value, int):
+				self.worksheet.write_number(self.row, col, value)
+			else:
+				self.worksheet.write_string(self.row, col, value)
+			self.widths[col] = max(self.widths[col], len(str(value)))
+
+	def close(self):
+		"""
+		Returns:
+			report_filename (str): filename used for admin email attachment
+		"""
+		from xlsxwriter.utility import xl_col_to_name
+		number_rows = self.row + 1
+		last_col    = xl_col_to_name(len(self.columns) - 1) # O, or P with the From Cache column
+		workbook    = self.workbook
+		worksheet   = self.worksheet
 		# Change cell colors
 		format_red    = workbook.add_format({'bg_color': '#FFC7CE', 'font_color': '#cf2d06'})
 		format_green  = workbook.add_format({'bg_color': '#C6EFCE', 'font_color': '#006100'})
 		format_yellow = workbook.add_format({'bg_color': '#FFEB9C', 'font_color': '#9c5700'})
-		worksheet.conditional_format(f'A2:O{number_rows}', {'type':'formula', 'criteria':'=$H2="ERROR"', 'format': format_yellow})             # Highlight row if Auth Rule == ERROR
+		worksheet.conditional_format(f'A2:{last_col}{number_rows}', {'type':'formula', 'criteria':'=$H2="ERROR"', 'format': format_yellow})             # Highlight row if Auth Rule == ERROR
 		worksheet.conditional_format(f'F2:F{number_rows}', {'type':'text', 'criteria':'containing', 'value': 'true', 'format': format_red})    # Column: Self Enrollment
 		worksheet.conditional_format(f'F2:F{number_rows}', {'type':'text', 'criteria':'containing', 'value': 'false', 'format': format_green}) # Column: Self Enrollment
 		worksheet.conditional_format(f'G2:G{number_rows}', {'type':'text', 'criteria':'containing', 'value': 'true', 'format': format_green})  # Column: LDAP
 		worksheet.conditional_format(f'G2:G{number_rows}', {'type':'text', 'criteria':'containing', 'value': 'false', 'format': format_red})   # Column: LDAP
-		worksheet.conditional_format(f'I2:I{number_rows}', {'type':'cell', 'criteria':'!=', 'value': '"0"', 'format': format_green})           # Column: Expiration Days
-		worksheet.conditional_format(f'I2:I{number_rows}', {'type':'cell', 'criteria':'==', 'value': '"0"', 'format': format_red})             # Column: Expiration Days
+		worksheet.conditional_format(f'I2:I{number_rows}', {'type':'cell', 'criteria':'!=', 'value': '0', 'format': format_green})             # Column: Expiration Days
+		worksheet.conditional_format(f'I2:I{number_rows}', {'type':'cell', 'criteria':'==', 'value': '0', 'format': format_red})               # Column: Expiration Days
 		worksheet.conditional_format(f'J2:J{number_rows}', {'type':'text', 'criteria':'containing', 'value': 'true', 'format': format_red})    # Column: PIN Doesnt Expire
 		worksheet.conditional_format(f'J2:J{number_rows}', {'type':'text', 'criteria':'containing', 'value': 'false', 'format': format_green}) # Column: PIN Doesnt Expire
 		worksheet.conditional_format(f'K2:K{number_rows}', {'type':'text', 'criteria':'containing', 'value': 'true', 'format': format_red})    # Column: PIN Must Change
@@ -612,57 +2231,470 @@ def generate_report():
 		worksheet.conditional_format(f'N2:N{number_rows}', {'type':'cell', 'criteria':'<=', 'value': '0', 'format': format_red})               # Column: Days Until Expired
 		worksheet.conditional_format(f'N2:N{number_rows}', {'type':'cell', 'criteria':'>', 'value': '0', 'format': format_green})              # Column: Days Until Expired
 		worksheet.conditional_format(f'O2:O{number_rows}', {'type':'text', 'criteria':'containing', 'value': 'true', 'format': format_green})  # Column: Expiration Email Sent
-		# Create a list of column headers, to use in add_table().
-		column_settings = [{'header': column} for column in df.columns]
-		worksheet.add_table(f'A1:O{number_rows}', {'columns': column_settings})
+		# add_table() is not supported in constant_memory mode, an autofilter on the header row gives the same sorting and filtering
+		worksheet.autofilter(0, 0, number_rows - 1, len(self.columns) - 1)
 		worksheet.freeze_panes(1, 3)
-		# Dynamically adjust all the column lengths
-		for column in df:
-			column_length = max(df[column].astype(str).map(len).max(), len(column))
-			col_idx = df.columns.get_loc(column)
-			writer.sheets['Summary'].set_column(col_idx, col_idx, column_length)
-		writer.save() # Close the Pandas Excel writer and output the Excel file.
-		logger.info(f"Report saved: {report_filename}")
-		return report_filename
+		# Column widths tracked by add()
+		for col_idx, column_length in enumerate(self.widths):
+			worksheet.set_column(col_idx, col_idx, column_length)
+		workbook.close()
+		logger.info(f"Report saved: {self.report_filename}")
+		return self.report_filename
+
+class CsvReportWriter:
+	"""
+	Writes the report as CSV one mailbox row at a time, the lightweight alternative to ReportWriter
+
+	Same add()/close() interface and columns. Flags are written as true/false and dates as yyyy-mm-dd,
+	like the XLSX report, there is no formatting.
+	"""
+	def __init__(self, report_filename):
+		self.report_filename = report_filename
+		self.columns = report_columns()
+		self.file    = open(os.path.join(cfg["reports_folder_name"], self.report_filename), "w", newline="", encoding="utf-8")
+		self.writer  = csv.writer(self.file)
+		self.writer.writerow([column for column, attr in self.columns])
+
+	def add(self, m):
+		"""
+		Args:
+			m (MailboxRecord): mailbox, None attributes are left blank
+		"""
+		row = []
+		for column, attr in self.columns:
+			value = getattr(m, attr)
+			if value is None:             value = ""
+			elif isinstance(value, bool): value = "true" if value else "false"
+			row.append(value)
+		self.writer.writerow(row)
+
+	def close(self):
+		"""
+		Returns:
+			report_filename (str): filename used for admin email attachment
+		"""
+		self.file.close()
+		logger.info(f"Report saved: {self.report_filename}")
+		return self.report_filename
+
+class NdjsonReportWriter:
+	"""
+	Writes the report as newline delimited JSON, one object per mailbox keyed by report column
+
+	Flags are JSON booleans, days are numbers, dates are yyyy-mm-dd strings and missing values are null,
+	so a data platform can load it without the XLSX/CSV text conversions.
+	"""
+	def __init__(self, report_filename):
+		self.report_filename = report_filename
+		self.columns = report_columns()
+		self.file    = open(os.path.join(cfg["reports_folder_name"], self.report_filename), "w", encoding="utf-8")
+
+	def add(self, m):
+		row = {column: getattr(m, attr) for column, attr in self.columns}
+		self.file.write(json.dumps(row, default=str) + "\n") # default=str writes dates as yyyy-mm-dd
+
+	def close(self):
+		self.file.close()
+		logger.info(f"Report saved: {self.report_filename}")
+		return self.report_filename
+
+class ParquetReportWriter:
+	"""
+	Writes the report as a zstd compressed Parquet file, needs the optional pyarrow package
+
+	Rows are buffered per column and written as a row group every PARQUET_ROW_GROUP mailboxes, so memory stays
+	flat however many mailboxes there are. Columns are typed: flags bool, days int64, dates date32, the rest string.
+	"""
+	PARQUET_ROW_GROUP = 50000
+	BOOL_ATTRS = ("self_enrollment", "ldap", "pin_doesnt_expire", "pin_must_change", "expiration_email_sent", "from_cache")
+	INT_ATTRS  = ("expiration_days", "days_until_expired")
+	DATE_ATTRS = ("date_last_changed", "expiration_date")
+
+	def __init__(self, report_filename):
+		import pyarrow as pa
+		import pyarrow.parquet as pq
+		self.pa              = pa
+		self.report_filename = report_filename
+		self.columns = report_columns()
+		types = {**{a: pa.bool_() for a in self.BOOL_ATTRS}, **{a: pa.int64() for a in self.INT_ATTRS}, **{a: pa.date32() for a in self.DATE_ATTRS}}
+		self.schema  = pa.schema([(column, types.get(attr, pa.string())) for column, attr in self.columns])
+		self.writer  = pq.ParquetWriter(os.path.join(cfg["reports_folder_name"], self.report_filename), self.schema, compression="zstd")
+		self.buffers = [[] for _ in self.columns]
+
+	def add(self, m):
+		for buffer, (column, attr) in zip(self.buffers, self.columns): buffer.append(getattr(m, attr))
+		if len(self.buffers[0]) >= self.PARQUET_ROW_GROUP: self.flush()
+
+	def flush(self):
+		if not self.buffers[0]: return
+		arrays = [self.pa.array(buffer, type=field.type) for buffer, field in zip(self.buffers, self.schema)]
+		self.writer.write_batch(self.pa.record_batch(arrays, schema=self.schema))
+		self.buffers = [[] for _ in self.columns]
+
+	def close(self):
+		self.flush()
+		self.writer.close()
+		logger.info(f"Report saved: {self.report_filename}")
+		return self.report_filename
+
+# report_format: writer class, also the file extension
+REPORT_WRITERS = {"xlsx": ReportWriter, "csv": CsvReportWriter, "ndjson": NdjsonReportWriter, "parquet": ParquetReportWriter}
+
+class ReportSinks:
+	"""
+	Writes the same mailbox rows to every report_format at once, with the same add()/close() interface as a single writer
+
+	- With one format the rows go straight to its writer
+	- With several, each writer runs on its own thread and rows are handed over in blocks through a bounded queue,
+	  so a slow writer like XLSX does not hold up the others and the caller only waits when a queue is full
+	- A writer that fails stops writing, the error is raised from close() once the other writers have finished
+	- Rows are also recorded in the HistoryStore when [HISTORY] is enabled, a history error is logged, history is
+	  dropped for the rest of the run and the report carries on, like record_reminders()
+	"""
+	BLOCK_ROWS   = 500
+	QUEUE_BLOCKS = 8
+
+	def __init__(self):
+		base          = 'ucxn_voicemail_pin_report_'+datetime.datetime.now().strftime("%Y-%m-%d-%I-%M-%S")
+		self.formats  = cfg["report_formats"]
+		self.writers  = [REPORT_WRITERS[f](f"{base}.{f}") for f in self.formats]
+		self.block    = []
+		self.queues   = []
+		self.threads  = []
+		self.results  = [None] * len(self.writers) # report filename or the exception
+		self.history  = None
+		if cfg["history_enabled"]: self.history = self._history(HistoryStore, cfg["history_file_fqdn"], "report")
+		if len(self.writers) == 1: return
+		for i, writer in enumerate(self.writers):
+			q = queue.Queue(maxsize=self.QUEUE_BLOCKS)
+			t = threading.Thread(target=self._worker, args=(i, writer, q), name=f"report-{self.formats[i]}", daemon=True)
+			t.start()
+			self.queues.append(q)
+			self.threads.append(t)
+
+	def _history(self, call, *args):
+		"""
+		Runs a HistoryStore call, on an error it is logged and history is not saved for the rest of the run
+
+		Returns:
+			the call's result, None after an error
+		"""
+		try:
+			return call(*args)
+		except Exception as e:
+			logger.error(f"Error: history was not saved: {e} on line {sys.exc_info()[2].tb_lineno}")
+			if self.history is not None:
+				with contextlib.suppress(Exception): self.history.conn.close() # rolls back the uncommitted rows
+			self.history = None
+
+	def _worker(self, i, writer, q):
+		time_busy = 0.0
+		while True:
+			block = q.get()
+			if block is None: break
+			if self.results[i] is not None: continue # failed, keep draining so add() never blocks
+			time_block = time.perf_counter()
+			try:
+				for m in block: writer.add(m)
+			except Exception as e:
+				self.results[i] = e
+			time_busy += time.perf_counter() - time_block
+		time_block = time.perf_counter()
+		if self.results[i] is None:
+			try:
+				self.results[i] = writer.close()
+			except Exception as e:
+				self.results[i] = e
+		metrics.observe("report_write", time_busy + time.perf_counter() - time_block, self.formats[i])
+
+	def add(self, m):
+		"""
+		Args:
+			m (MailboxRecord): mailbox
+		"""
+		if self.history is not None: self._history(self.history.add, m)
+		if not self.queues: return self.writers[0].add(m)
+		self.block.append(m)
+		if len(self.block) >= self.BLOCK_ROWS:
+			for q in self.queues: q.put(self.block)
+			self.block = []
+
+	def close(self):
+		"""
+		Returns:
+			report_files (list[str]): file names in the reports folder, in report_format order
+		"""
+		if self.history is not None: self._history(self.history.close)
+		if not self.queues: return [self.writers[0].close()]
+		for q in self.queues:
+			if self.block: q.put(self.block)
+			q.put(None)
+		for t in self.threads: t.join()
+		for result in self.results:
+			if isinstance(result, Exception): raise result
+		return self.results
+
+def open_report():
+	"""
+	Returns:
+		report (ReportSinks): writers for the configured report_format list
+	"""
+	return ReportSinks()
+
+def generate_report(rows):
+	"""
+	Generates the PIN report files
+
+	- Writes each mailbox to every configured writer through ReportSinks
+	- Saves as XLSX, CSV, NDJSON and/or Parquet files, see report_format
+
+	Args:
+		rows (list[MailboxRecord]): mailboxes
+
+	Returns:
+		report_files (list[str]): file names used for the admin email
+	"""
+	try:
+		report = open_report()
+		for m in rows: report.add(m)
+		return report.close()
 	except Exception as e:
 		logger.error(f"Error: report was not saved: {e} on line {sys.exc_info()[2].tb_lineno}")
 		send_admin_email_error()
 		sys.exit(1)
 
-def purge_files(retention_days, file_dir, file_ext):
+class HistoryStore:
+	"""
+	On disk SQLite history of every run, so trends are answered from indexed rollups instead of old reports
+
+	- runs: the stats of every run, appended
+	- snapshots: the PIN state of each mailbox per day, kept for snapshot_days
+	- reminders: every reminder sent, marked converted when a snapshot within CONVERSION_DAYS shows the PIN changed since
+	- daily: one row per day with the report counters and reminders sent/converted, updated at the end of each run
+
+	Args:
+		file_fqdn (str): SQLite database file
+		job (str): report or reminders, the reminder job only records the reminders it sent
+	"""
+	CONVERSION_DAYS = 30
+	SCHEMA = """
+		CREATE TABLE IF NOT EXISTS runs (
+			run_at TEXT, job TEXT, mailboxes INTEGER, with_exp_days INTEGER, without_exp_days INTEGER, expired_pins INTEGER,
+			changed_24hr INTEGER, mailbox_errors INTEGER, emails_sent INTEGER, email_failures INTEGER, runtime_seconds INTEGER
+		);
+		CREATE TABLE IF NOT EXISTS snapshots (
+			day TEXT, object_id TEXT, cluster TEXT, auth_rule TEXT, days_until_expired INTEGER, date_last_changed TEXT,
+			PRIMARY KEY (day, object_id)
+		) WITHOUT ROWID;
+		CREATE TABLE IF NOT EXISTS reminders (
+			object_id TEXT, sent_on TEXT, converted_on TEXT,
+			PRIMARY KEY (object_id, sent_on)
+		) WITHOUT ROWID;
+		CREATE INDEX IF NOT EXISTS reminders_sent_on ON reminders (sent_on);
+		CREATE INDEX IF NOT EXISTS reminders_converted_on ON reminders (converted_on);
+		CREATE TABLE IF NOT EXISTS daily (
+			day TEXT PRIMARY KEY, mailboxes INTEGER, with_exp_days INTEGER, without_exp_days INTEGER, expired_pins INTEGER,
+			changed_24hr INTEGER, mailbox_errors INTEGER, reminders_sent INTEGER DEFAULT 0, reminders_converted INTEGER DEFAULT 0
+		);
+	"""
+
+	def __init__(self, file_fqdn, job):
+		import sqlite3
+		self.conn      = sqlite3.connect(file_fqdn)
+		self.conn.executescript(self.SCHEMA)
+		self.job       = job
+		self.day       = today.date().isoformat()
+		self.snapshots = []
+		self.reminders = []
+		if job == "report": self.conn.execute("DELETE FROM snapshots WHERE day = ?", (self.day,)) # a second report the same day replaces the first
+
+	def add(self, m):
+		"""
+		Args:
+			m (MailboxRecord): mailbox, errored mailboxes and mailboxes without PIN data are not snapshotted
+		"""
+		if m.expiration_email_sent: self.reminders.append((m.object_id, self.day))
+		if self.job == "report" and m.auth_rule not in (None, "ERROR"):
+			never = m.pin_doesnt_expire or m.expiration_days == 0
+			self.snapshots.append((self.day, m.object_id, m.cluster, m.auth_rule, None if never else m.days_until_expired, m.date_last_changed.isoformat()))
+		if len(self.snapshots) >= 5000: self.flush()
+
+	def flush(self):
+		self.conn.executemany("INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?, ?, ?)", self.snapshots)
+		self.conn.executemany("INSERT OR IGNORE INTO reminders (object_id, sent_on) VALUES (?, ?)", self.reminders)
+		self.snapshots = []
+		self.reminders = []
+
+	def close(self):
+		"""
+		Appends the run stats, marks converted reminders, updates the daily rollup, drops old snapshots, commits and closes
+		"""
+		self.flush()
+		runtime = (datetime.datetime.now() - time_start).seconds
+		self.conn.execute(
+			"INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+			(time_start.isoformat(timespec="seconds"), self.job, int(total_mailboxes), mailboxes_with_exp_days, mailboxes_without_exp_days, total_expired_pins,
+			total_24hr_pin_changes, total_mailbox_errors, total_user_emails_sent, total_user_email_failures, runtime)
+		)
+		self.conn.execute("INSERT OR IGNORE INTO daily (day) VALUES (?)", (self.day,))
+		if self.job == "report":
+			since = (today - datetime.timedelta(days=self.CONVERSION_DAYS)).date().isoformat()
+			self.conn.execute("""
+				UPDATE reminders SET converted_on = :day WHERE converted_on IS NULL AND sent_on >= :since AND EXISTS (
+					SELECT 1 FROM snapshots s WHERE s.day = :day AND s.object_id = reminders.object_id AND s.date_last_changed >= reminders.sent_on
+				)""", {"day": self.day, "since": since})
+			self.conn.execute(
+				"UPDATE daily SET mailboxes = ?, with_exp_days = ?, without_exp_days = ?, expired_pins = ?, changed_24hr = ?, mailbox_errors = ? WHERE day = ?",
+				(int(total_mailboxes), mailboxes_with_exp_days, mailboxes_without_exp_days, total_expired_pins, total_24hr_pin_changes, total_mailbox_errors, self.day)
+			)
+		self.conn.execute("""
+			UPDATE daily SET
+				reminders_sent      = (SELECT COUNT(*) FROM reminders WHERE sent_on = :day),
+				reminders_converted = (SELECT COUNT(*) FROM reminders WHERE converted_on = :day)
+			WHERE day = :day""", {"day": self.day})
+		cutoff = (today - datetime.timedelta(days=cfg["history_snapshot_days"])).date().isoformat()
+		self.conn.execute("DELETE FROM snapshots WHERE day < ?", (cutoff,))
+		self.conn.execute("DELETE FROM reminders WHERE sent_on < ?", (cutoff,))
+		self.conn.commit()
+		self.conn.close()
+
+def record_reminders():
 	"""
-	Purges files past a certain date
+	Records the reminders sent by a reminder job in the HistoryStore, a history error is logged and the job carries on
 	"""
 	try:
-		if retention_days > 0:
-			logger.debug(f"Purging {file_ext} files in {file_dir} folder older than {retention_days} days...")
-			retention_sec = retention_days*86400
-			now = time.time()
-			for file in os.listdir(file_dir):
-				if file.endswith(file_ext):
-					file_fullpath = os.path.join(file_dir, file)
-					if os.stat(file_fullpath).st_mtime < (now-retention_sec):
-						os.remove(file_fullpath)
-						logger.debug(f"{file} has been deleted")
+		history = HistoryStore(cfg["history_file_fqdn"], "reminders")
+		for m in mailboxes: history.add(m)
+		history.close()
 	except Exception as e:
-		logger.debug("File purge error: " + str(e))
+		logger.error(f"Error: history was not saved: {e} on line {sys.exc_info()[2].tb_lineno}")
 
-if __name__ == "__main__":
+def print_trend():
+	"""
+	Prints the daily rollups of the last trend_days from the HistoryStore, used by -trend
+
+	The conversion rate is the share of reminders sent in the window whose PIN was changed within CONVERSION_DAYS.
+	"""
+	import sqlite3
+	if not os.path.isfile(cfg["history_file_fqdn"]):
+		print("No history yet, set enabled = true under [HISTORY] in config.ini")
+		return
+	since = (datetime.date.today() - datetime.timedelta(days=cfg["trend_days"])).isoformat()
+	conn  = sqlite3.connect(cfg["history_file_fqdn"])
+	rows  = conn.execute(
+		"SELECT day, mailboxes, expired_pins, changed_24hr, mailbox_errors, reminders_sent, reminders_converted FROM daily WHERE day >= ? ORDER BY day", (since,)
+	).fetchall()
+	sent, converted = conn.execute("SELECT COUNT(*), COUNT(converted_on) FROM reminders WHERE sent_on >= ?", (since,)).fetchone()
+	conn.close()
+
+	print(f"{'Day':<12}{'Mailboxes':>11}{'Expired PINs':>14}{'Changed 24hrs':>15}{'Errors':>8}{'Reminders':>11}{'Converted':>11}")
+	for r in rows:
+		print(f"{r[0]:<12}" + "".join(f"{'' if v is None else v:>{w}}" for v, w in zip(r[1:], (11, 14, 15, 8, 11, 11))))
+	reported = [r for r in rows if r[2] is not None]
+	if len(reported) > 1: print(f"\nExpired PINs {reported[0][2]} on {reported[0][0]}, {reported[-1][2]} on {reported[-1][0]}")
+	rate = f"{converted/sent:.1%}" if sent else "n/a"
+	print(f"Reminders sent in the last {cfg['trend_days']} days: {sent}, PIN changed within {HistoryStore.CONVERSION_DAYS} days: {converted} ({rate})")
+
+ARCHIVE_RE = re.compile(r"-archive-(\d{4}-\d\d-\d\d)(-\d+)?\.tar\.gz(\.tmp)?$")
+
+def retain_folder(file_dir, file_exts, archive_days, retention_days):
+	"""
+	Applies the retention settings to one folder, in a single os.scandir pass
+
+	- Files past retention_days are deleted
+	- Files past archive_days are moved into a tarball per day they were last written, <folder>-archive-YYYY-MM-DD.tar.gz
+	  in the same folder, archive age is counted in whole days so a day's files are archived together
+	- Tarballs are deleted once their day is past retention_days
+	A tarball is written under a temporary name and renamed before its files are deleted. A .tmp left by an interrupted
+	run is deleted, its files were not, so they are archived again.
+
+	Args:
+		file_dir (str): folder
+		file_exts (tuple[str]): extensions of the files retention applies to
+		archive_days (int): 0 never archives
+		retention_days (int): 0 never deletes
+
+	Returns:
+		(archived, deleted) (tuple): number of files archived, number of files and tarballs deleted
+	"""
+	import tarfile
+	now        = time.time()
+	today_date = datetime.date.today()
+	delete_before  = now - retention_days*86400
+	archive_before = today_date - datetime.timedelta(days=archive_days - 1) # whole days, yesterday's files with archive_days 1
+	prefix     = os.path.basename(os.path.normpath(file_dir))
+	to_archive = collections.defaultdict(list)
+	archives   = set()
+	deleted    = 0
+	with os.scandir(file_dir) as entries:
+		for entry in entries:
+			archive_day = ARCHIVE_RE.search(entry.name)
+			if archive_day and archive_day.group(3):
+				os.remove(entry.path)
+				deleted += 1
+				logger.debug("%s was left by an interrupted run and has been deleted", entry.name)
+				continue
+			if archive_day:
+				archives.add(entry.name)
+				day = datetime.date.fromisoformat(archive_day.group(1))
+				if retention_days > 0 and (today_date - day).days >= retention_days:
+					os.remove(entry.path)
+					deleted += 1
+					logger.debug("%s has been deleted", entry.name)
+				continue
+			if not entry.name.endswith(file_exts) or not entry.is_file(): continue
+			mtime = entry.stat().st_mtime # the only stat, and only for files retention applies to
+			if retention_days > 0 and mtime < delete_before:
+				os.remove(entry.path)
+				deleted += 1
+				logger.debug("%s has been deleted", entry.name)
+			elif archive_days > 0 and datetime.date.fromtimestamp(mtime) < archive_before:
+				to_archive[datetime.date.fromtimestamp(mtime)].append(entry)
+
+	archived = 0
+	for day, day_entries in sorted(to_archive.items()):
+		archive_name = f"{prefix}-archive-{day}.tar.gz"
+		n = 1
+		while archive_name in archives: # a day archived by an earlier run, e.g. after archive_days was lowered
+			n += 1
+			archive_name = f"{prefix}-archive-{day}-{n}.tar.gz"
+		archives.add(archive_name)
+		archive_fqdn = os.path.join(file_dir, archive_name)
+		try:
+			with tarfile.open(archive_fqdn + ".tmp", "w:gz", compresslevel=6) as tar:
+				for entry in sorted(day_entries, key=lambda e: e.name): tar.add(entry.path, arcname=entry.name)
+			os.replace(archive_fqdn + ".tmp", archive_fqdn)
+		except BaseException:
+			with contextlib.suppress(FileNotFoundError): os.remove(archive_fqdn + ".tmp")
+			raise
+		for entry in day_entries: os.remove(entry.path)
+		archived += len(day_entries)
+		logger.debug("%s files archived to %s", len(day_entries), archive_name)
+	return archived, deleted
+
+def run_retention():
+	"""
+	Archives and purges the logs and reports folders, see retain_folder()
+	"""
 	try:
-		usage_help = "\nUsage: python pin-reminder.py [OPTION]\n\nOptional Arguments:\n  -n, -noemail     generates report but does not send user or admin emails\n  -h, -help        display this help and exit"
-		
-		if   sys.argv[1] == "-n" or sys.argv[1] == "-noemail":
-			rmode = "noemail"
-		elif sys.argv[1] == "-h" or sys.argv[1] == "-help":
-			print(usage_help)
-			sys.exit(0)
-		else:
-			print(f"\n{sys.argv[1]} is not a valid option")
-			print(usage_help)
-			sys.exit(1)
-	except IndexError as e:
-		rmode = None
+		with metrics.timer("retention"):
+			for file_dir, file_exts in ((cfg["logs_folder_name"], (".log", ".json")), (cfg["reports_folder_name"], tuple("." + f for f in REPORT_WRITERS))):
+				logger.debug("Retention in %s folder, archive after %s days, delete after %s days...", file_dir, cfg["archive_days"], cfg["retention_days"])
+				archived, deleted = retain_folder(file_dir, file_exts, cfg["archive_days"], cfg["retention_days"])
+				metrics.count("retention_archived", file_dir, archived)
+				metrics.count("retention_deleted",  file_dir, deleted)
+				if archived or deleted: logger.info(f"Retention: {archived} files archived, {deleted} files deleted in {file_dir} folder")
+	except Exception as e:
+		logger.error(f"Error: retention failed: {e} on line {sys.exc_info()[2].tb_lineno}")
 
+def reset_run_stats():
+	"""
+	Resets the per run dates, counters and metrics, a daemon process runs the tool many times
+
+	Reminders sent on earlier days are dropped from reminders_sent.
+	"""
+	global today, time_start, total_mailboxes, mailboxes_with_exp_days, mailboxes_without_exp_days, total_expired_pins, total_24hr_pin_changes
+	global total_user_emails_sent, total_user_email_failures, email_throughput, total_mailbox_errors, pin_cache_rows, metrics, cluster_stats, reminders_sent
 	today                      = datetime.datetime.today()
 	time_start                 = datetime.datetime.now()
 	total_mailboxes            = 0
@@ -671,7 +2703,264 @@ if __name__ == "__main__":
 	total_expired_pins         = 0
 	total_24hr_pin_changes     = 0
 	total_user_emails_sent     = 0
+	total_user_email_failures  = 0
+	email_throughput           = 0
 	total_mailbox_errors       = 0
+	pin_cache_rows             = {}
+	metrics                    = Metrics()
+	cluster_stats              = []
+	reminders_sent             = {k: v for k, v in reminders_sent.items() if v == today.date()}
+
+def run_tool(job="report", resume=False):
+	"""
+	Runs the tool once, with a Checkpoint of the PIN data and reminders so far that is removed when it finishes.
+	If the run fails the checkpoint is kept for -resume, it and the SentLog are closed either way.
+
+	- report: all six steps, the report and admin email
+	- reminders: steps 1-4 only, PIN data only for mailboxes that could be due today, see get_pin_data().
+	  The cached auth rules are reused when the daemon already has them
+
+	Args:
+		job (str): report or reminders
+		resume (bool): continue from the checkpoint left by an interrupted run, see -resume
+	"""
+	global authrules, mailboxes, report_files, time_total, reminders_only, checkpoint, sent_log
+	reset_run_stats()
+	reminders_only = job == "reminders"
+	if reminders_only: logger.info("Running reminder job, no report or admin email")
+	checkpoint = Checkpoint(cfg["checkpoint_file_fqdn"], resume)
+	finished   = False
+	try:
+		for object_id in checkpoint.sent: reminders_sent[object_id] = today.date()
+		sent_log = SentLog(cfg["sent_file_fqdn"])
+		for object_id in sent_log.sent: reminders_sent[object_id] = today.date()
+		if sent_log.sent: logger.info(f"{len(sent_log.sent)} reminders were already sent today by an earlier run, they are not sent again")
+
+		if len(cfg["clusters"]) > 1:
+			if cfg["streaming"]: logger.info("Streaming mode is not used with multiple clusters, running in batch mode")
+			logger.info(f"Steps 1-3 of 6: Getting auth rules, mailboxes and PIN data from {len(cfg['clusters'])} clusters...")
+			with metrics.timer("step", "1-3 clusters"):
+				mailboxes = get_clusters(resume)
+		elif reminders_only and authrules is not None:
+			logger.info("Step 1 of 6: Getting auth rules... using the cached auth rules")
+		else:
+			logger.info("Step 1 of 6: Getting auth rules...")
+			with metrics.timer("step", "1 auth rules"):
+				authrules = get_auth_rules()
+
+		if cfg["streaming"] and len(cfg["clusters"]) == 1 and not reminders_only:
+			logger.info("Steps 2-5 of 6: Streaming mailboxes, PIN data, user emails and report...")
+			if rmode == "noemail": logger.info("Sending User Emails... SKIPPED due to -noemail arg")
+			with metrics.timer("step", "2-5 stream"):
+				report_files = stream_mailboxes()
+		else:
+			if len(cfg["clusters"]) == 1:
+				logger.info("Step 2 of 6: Getting mailboxes...")
+				with metrics.timer("step", "2 mailboxes"):
+					mailboxes = get_mailboxes()
+
+				logger.info("Step 3 of 6: Getting PIN data...")
+				with metrics.timer("step", "3 pin data"):
+					get_pin_data()
+
+			if not rmode == "noemail":
+				logger.info("Step 4 of 6: Sending User Emails...")
+				with metrics.timer("step", "4 user emails"):
+					send_user_email()
+			else:
+				logger.info("Step 4 of 6: Sending User Emails... SKIPPED due to -noemail arg")
+
+			if not reminders_only:
+				logger.info("Step 5 of 6: Saving Report...")
+				with metrics.timer("step", "5 report"):
+					report_files = generate_report(mailboxes)
+			else:
+				logger.info("Step 5 of 6: Saving Report... SKIPPED for the reminder job")
+				if cfg["history_enabled"]: record_reminders()
+
+		time_end   = datetime.datetime.now()
+		time_total = divmod((time_end - time_start).seconds, 60)
+
+		retention = threading.Thread(target=run_retention, name="retention") # overlaps the admin email, only touches files from earlier days
+		retention.start()
+
+		if rmode == "noemail":
+			logger.info("Step 6 of 6: Sending Admin Email... SKIPPED due to -noemail arg")
+		elif reminders_only:
+			logger.info("Step 6 of 6: Sending Admin Email... SKIPPED for the reminder job")
+		else:
+			logger.info("Step 6 of 6: Sending Admin Email...")
+			with metrics.timer("step", "6 admin email"):
+				send_admin_email()
+
+		finished = True
+	finally: # a failed run keeps its checkpoint for -resume, a daemon job must not leave either file open
+		checkpoint.close(finished)
+		if sent_log is not None: sent_log.close()
+		sent_log = None
+	if len(cfg["clusters"]) > 1:
+		for c in cfg["clusters"]:
+			with contextlib.suppress(FileNotFoundError): os.remove(cluster_file(c["name"], "checkpoint", ".ndjson"))
+
+	retention.join()
+	write_metrics()
+
+	tool_stats_str = f"Total Mailboxes: {total_mailboxes} Total Emails Sent: {total_user_emails_sent} Total Email Failures: {total_user_email_failures} Total Mailbox Errors: {total_mailbox_errors}"
+	print('='*(tool_stats_str.count('')+25))
+	logger.info(tool_stats_str)
+	logger.info(f"Tool Runtime: {time_total[0]} minutes {time_total[1]} seconds")
+	logger.info("Tool Finished")
+
+def reload_config():
+	"""
+	Re-reads config.ini if it changed since it was last read
+
+	- A config that fails validation is logged and the running config is kept
+	- The SMTP pool and UCXN session are only recreated if their settings changed, which also drops the cached auth rules
+
+	Returns:
+		changed (bool): the new config is in use
+	"""
+	global cfg, config_mtime, smtp_pool, email_assets, authrules
+	try:
+		mtime = os.stat("config.ini").st_mtime
+	except OSError as e:
+		logger.error(f"Error: config.ini could not be read: {e}")
+		return False
+	if mtime == config_mtime: return False
+	config_mtime = mtime
+
+	old_cfg = cfg
+	try:
+		cfg = read_ini("config.ini")
+		validate_ini("config.ini")
+		email_assets = load_email_assets()
+	except SystemExit: # the error was logged by read_ini, validate_ini or load_email_assets
+		logger.error("Error: config.ini changes were not applied, still running with the previous config")
+		cfg = old_cfg
+		return False
+	apply_log_settings(cfg["log_format"], cfg["log_max_mb"], cfg["log_backups"])
+	logger.info("config.ini changed, config reloaded")
+
+	if any(old_cfg[k] != cfg[k] for k in ("smtp_server", "smtp_connections", "smtp_max_messages")):
+		smtp_pool.close()
+		smtp_pool = SMTPPool(cfg['smtp_server'], cfg['smtp_connections'], cfg['smtp_max_messages'])
+	if any(old_cfg[k] != cfg[k] for k in ("clusters", "creds", "base_url", "pin_workers", "page_workers")):
+		authrules = None
+		if len(cfg["clusters"]) == 1: init_ucxn_session()
+	return True
+
+def next_report_time(now):
+	"""
+	Returns:
+		when (datetime.datetime): the next report_time after now
+	"""
+	report_time = datetime.datetime.strptime(cfg["report_time"], "%H:%M")
+	when = now.replace(hour=report_time.hour, minute=report_time.minute, second=0, microsecond=0)
+	return when if when > now else when + datetime.timedelta(days=1)
+
+class DaemonStop(BaseException):
+	"""
+	Raised by the SIGTERM handler, a BaseException so the job error handling does not mistake it for a failed job
+	"""
+
+def stop_daemon(signum, frame):
+	raise DaemonStop()
+
+def run_daemon(resume=False):
+	"""
+	Runs the report and reminder jobs on the [DAEMON] schedule until stopped
+
+	- The report job runs daily at report_time, the reminder job every reminder_interval_minutes
+	- The UCXN session, SMTP pool and auth rules stay warm between jobs
+	- config.ini changes are picked up while waiting, the schedule restarts from the new settings
+	- A failed job is logged and the daemon waits for the next one, which resumes from the failed job's checkpoint
+	- SIGTERM or Ctrl+C stops the daemon, also in the middle of a job, which leaves its checkpoint for -resume
+
+	Args:
+		resume (bool): the first job resumes from the checkpoint, see -resume
+	"""
+	global show_progress
+	show_progress = False
+	signal.signal(signal.SIGTERM, stop_daemon) # returns from run_daemon so atexit closes the SMTP pool
+	logger.info("Daemon started, stop with Ctrl+C")
+	try:
+		daemon_loop(resume)
+	except (DaemonStop, KeyboardInterrupt) as e:
+		logger.info("Daemon stopped by " + ("SIGTERM" if isinstance(e, DaemonStop) else "Ctrl+C"))
+
+def daemon_loop(resume):
+	"""
+	The run_daemon schedule loop, runs until it is stopped by DaemonStop (SIGTERM) or KeyboardInterrupt (Ctrl+C),
+	either is raised wherever the main thread is, in a job or in the sleep between jobs, and run_daemon catches it
+	"""
+	schedule = None
+	while True:
+		if reload_config() or schedule is None:
+			now = datetime.datetime.now()
+			schedule = {"report": next_report_time(now)}
+			if cfg["reminder_interval"] > 0: schedule["reminders"] = now + datetime.timedelta(minutes=cfg["reminder_interval"])
+			for job, when in schedule.items(): logger.info(f"Next {job} job at {when:%Y-%m-%d %H:%M}")
+
+		job, when = min(schedule.items(), key=lambda x: x[1])
+		wait = (when - datetime.datetime.now()).total_seconds()
+		if wait > 0:
+			time.sleep(min(wait, 60)) # wakes up at least every minute to check for config changes
+			continue
+
+		try:
+			run_tool(job, resume)
+			resume = False
+		except SystemExit as e: # the error was logged and emailed where it happened
+			if e.code in (0, None): raise
+			logger.error(f"Error: the {job} job failed, waiting for the next job")
+			resume = True
+		except Exception as e:
+			logger.error(f"Error: the {job} job failed: {e} on line {sys.exc_info()[2].tb_lineno}")
+			resume = True
+
+		now = datetime.datetime.now()
+		schedule["report"] = next_report_time(now) if job == "report" else schedule["report"]
+		if job == "reminders": schedule["reminders"] = now + datetime.timedelta(minutes=cfg["reminder_interval"])
+		logger.info(f"Next {job} job at {schedule[job]:%Y-%m-%d %H:%M}")
+
+if __name__ == "__main__":
+	if getattr(sys, "frozen", False): # cluster processes in the pyinstaller build
+		import multiprocessing
+		multiprocessing.freeze_support()
+	usage_help = "\nUsage: python pin-reminder.py [OPTION]...\n\nOptional Arguments:\n  -n, -noemail     generates report but does not send user or admin emails\n  -f, -full        ignores the PIN cache and fetches the PIN data for every mailbox\n  -r, -reminders   only sends the reminder emails due today, no report or admin email\n  -resume          continues a run that was interrupted today from its checkpoint, instead of starting over\n  -t, -trend       prints the daily history of the last trend_days and exits, see [HISTORY] in config.ini\n  -d, -daemon      keeps running and schedules the report and reminder jobs, see [DAEMON] in config.ini\n  -h, -help        display this help and exit"
+	rmode        = None
+	full_refresh = False
+	daemon       = False
+	job          = "report"
+	resume       = False
+	for arg in sys.argv[1:]:
+		if   arg == "-n" or arg == "-noemail":
+			rmode = "noemail"
+		elif arg == "-f" or arg == "-full":
+			full_refresh = True
+		elif arg == "-r" or arg == "-reminders":
+			job = "reminders"
+		elif arg == "-resume":
+			resume = True
+		elif arg == "-t" or arg == "-trend":
+			job = "trend"
+		elif arg == "-d" or arg == "-daemon":
+			daemon = True
+		elif arg == "-h" or arg == "-help":
+			print(usage_help)
+			sys.exit(0)
+		else:
+			print(f"\n{arg} is not a valid option")
+			print(usage_help)
+			sys.exit(1)
+
+	reminders_sent             = {} # ObjectId: date, stops a mailbox being sent two reminders in a day, loaded from the SentLog every run
+	sent_log                   = None
+	authrules                  = None
+	reminders_only             = False
+	show_progress              = True
+	reset_run_stats()
 
 	# Initiate logger
 	logger = logging.getLogger('global-log')
@@ -683,46 +2972,21 @@ if __name__ == "__main__":
 
 	cfg = read_ini("config.ini")
 	validate_ini("config.ini")
+	apply_log_settings(cfg["log_format"], cfg["log_max_mb"], cfg["log_backups"])
 
-	logger.info(f"UCXN Server = {cfg['ucxn_server']}")
+	if job == "trend":
+		print_trend()
+		sys.exit(0)
 
-	ucxn_session = requests.Session()
-	ucxn_session.auth = cfg["creds"]
-	ucxn_session.headers.update(headers)
-	ucxn_session.verify = False
-
-	logger.info("Step 1 of 6: Getting auth rules...")
-	authrules = get_auth_rules()
-
-	logger.info("Step 2 of 6: Getting mailboxes...")
-	mailboxes = get_mailboxes()
-	
-	logger.info("Step 3 of 6: Getting PIN data...")
-	get_pin_data()
-
-	if not rmode == "noemail":
-		logger.info("Step 4 of 6: Sending User Emails...")
-		send_user_email()
-	else:
-		logger.info("Step 4 of 6: Sending User Emails... SKIPPED due to -noemail arg")
-
-	logger.info("Step 5 of 6: Saving Report...")
-	report_filename = generate_report()
+	for c in cfg["clusters"]: logger.info(f"UCXN Server = {c['server']}" + (f" ({c['name']})" if c["name"] != c["server"] else ""))
 
-	time_end   = datetime.datetime.now()
-	time_total = divmod((time_end - time_start).seconds, 60)
+	config_mtime = os.stat("config.ini").st_mtime
+	smtp_pool = SMTPPool(cfg['smtp_server'], cfg['smtp_connections'], cfg['smtp_max_messages'])
+	atexit.register(lambda: smtp_pool.close()) # also quits the connections on the sys.exit error paths, a daemon reload may replace the pool
+	email_assets = load_email_assets()
+	if len(cfg["clusters"]) == 1: init_ucxn_session()
 
-	if not rmode == "noemail":
-		logger.info("Step 6 of 6: Sending Admin Email...")
-		send_admin_email()
+	if daemon:
+		run_daemon(resume)
 	else:
-		logger.info("Step 6 of 6: Sending Admin Email... SKIPPED due to -noemail arg")
-
-	purge_files(cfg['retention_days'], cfg["logs_folder_name"], ".log")
-	purge_files(cfg['retention_days'], cfg["reports_folder_name"], ".xlsx")
-
-	tool_stats_str = f"Total Mailboxes: {total_mailboxes} Total Emails Sent: {total_user_emails_sent} Total Mailbox Errors: {total_mailbox_errors}"
-	print('='*(tool_stats_str.count('')+25))
-	logger.info(tool_stats_str)
-	logger.info(f"Tool Runtime: {time_total[0]} minutes {time_total[1]} seconds")
-	logger.info("Tool Finished")
\ No newline at end of file
+		run_tool(job, resume)